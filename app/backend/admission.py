@@ -0,0 +1,131 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Hashable
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted; carries a Retry-After hint in seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """Bounded, per-conversation fair queue in front of LLM-bound work.
+
+    At most ``max_concurrent`` requests run at once. Others wait in per-key
+    queues served round-robin, so one busy conversation cannot starve the
+    rest. When the queue is full, a key has too many pending requests, or a
+    request waits longer than ``max_wait`` seconds, it is rejected with
+    ``Overloaded`` rather than slowing every admitted request down.
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_queue: int = 32,
+                 max_queued_per_key: int = 2, max_wait: float = 20.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queued_per_key = max_queued_per_key
+        self.max_wait = max_wait
+        self.active = 0
+        self.queued = 0
+        self.queues: "OrderedDict[Hashable, deque]" = OrderedDict()
+        self.avg_service_time = 2.0  # Seconds, exponentially weighted
+        self.stats = {"admitted": 0, "rejected": 0, "timed_out": 0,
+                      "total_wait": 0.0, "max_wait": 0.0}
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable):
+        """Hold one execution slot for the duration of the block"""
+        await self.acquire(key)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * (time.monotonic() - start)
+            self.release()
+
+    async def acquire(self, key: Hashable):
+        if self.active < self.max_concurrent and self.queued == 0:
+            self.active += 1
+            self._record_admission(0.0)
+            return
+
+        if self.queued >= self.max_queue:
+            self._reject("Server is at capacity, please retry shortly")
+        queue = self.queues.setdefault(key, deque())
+        if len(queue) >= self.max_queued_per_key:
+            self._reject("Too many pending requests for this conversation")
+
+        future = asyncio.get_running_loop().create_future()
+        queue.append(future)
+        self.queued += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done():
+                # The slot was handed over just as the wait ended
+                if isinstance(e, asyncio.CancelledError):
+                    self.release()
+                    raise
+            else:
+                future.cancel()
+                self._discard(key, future)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                self.stats["timed_out"] += 1
+                self._reject("Timed out waiting for capacity, please retry shortly")
+        self._record_admission(time.monotonic() - start)
+
+    def release(self):
+        """Hand the slot to the next waiter, round-robin across keys, or free it"""
+        while self.queues:
+            key, queue = self.queues.popitem(last=False)
+            future = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self.queues[key] = queue  # Rotate the key to the back
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def _discard(self, key: Hashable, future: asyncio.Future):
+        queue = self.queues.get(key)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self.queued -= 1
+            if not queue:
+                del self.queues[key]
+
+    def _record_admission(self, wait: float):
+        self.stats["admitted"] += 1
+        self.stats["total_wait"] += wait
+        self.stats["max_wait"] = max(self.stats["max_wait"], wait)
+
+    def _reject(self, reason: str):
+        self.stats["rejected"] += 1
+        raise Overloaded(reason, self.retry_after())
+
+    def retry_after(self) -> int:
+        """Estimated seconds until the current queue drains"""
+        return max(1, math.ceil((self.queued + 1) / self.max_concurrent * self.avg_service_time))
+
+    def get_stats(self) -> Dict:
+        admitted = self.stats["admitted"]
+        return {
+            "active": self.active,
+            "queue_depth": self.queued,
+            "queued_conversations": len(self.queues),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "admitted": admitted,
+            "rejected": self.stats["rejected"],
+            "timed_out": self.stats["timed_out"],
+            "avg_wait_ms": self.stats["total_wait"] / admitted * 1000 if admitted else 0.0,
+            "max_wait_ms": self.stats["max_wait"] * 1000,
+            "avg_service_ms": self.avg_service_time * 1000
+        }
@@ -0,0 +1,148 @@
+import os
+import re
+import json
+import tempfile
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import List, Dict, Optional
+from app.frontend.sample_questions import SAMPLE_QUESTIONS
+from app.retrieval.artifacts import file_lock
+
+def normalize_question(question: str) -> str:
+    """Normalize a question for exact-match lookups (case, punctuation, whitespace)"""
+    question = re.sub(r'[^\w\s]', ' ', question.lower())
+    return re.sub(r'\s+', ' ', question).strip()
+
+class AnswerStore:
+    """Precomputed answers for frequent context-free questions, tagged with the index version"""
+
+    def __init__(self, path: str = "models/precomputed_answers.json", index_version: Optional[str] = None, k: int = 3):
+        self.path = path
+        self.index_version = index_version
+        self.k = k
+        self.answers = {}
+        self.stored_version = None
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Load answers from disk, keeping them only if they match the current index"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.stored_version = data.get("index_version")
+        if self.stored_version == self.index_version:
+            self.answers = data.get("answers", {})
+            print(f"⚡ Loaded {len(self.answers)} precomputed answers (index {self.index_version})")
+        else:
+            print(f"⚠️  Precomputed answers are for index {self.stored_version}, current is {self.index_version}")
+
+    def is_stale(self) -> bool:
+        """True when the store is missing or was built for another index version"""
+        return self.stored_version != self.index_version
+
+    def lookup(self, question: str, k: int = 3) -> Optional[Dict]:
+        """Return the stored answer for a question, or None"""
+        entry = self.answers.get(normalize_question(question)) if k == self.k else None
+        with self._lock:
+            self.stats["hits" if entry else "misses"] += 1
+        return entry
+
+    def refresh(self, pipeline, questions: List[str], force: bool = False):
+        """Run the pipeline for each question and atomically replace the stored answers.
+
+        Only one API worker refreshes a store: the others wait on the lock,
+        then read the answers it wrote for the current index version.
+        ``force`` rebuilds even a current store.
+        """
+        with file_lock(os.path.join(os.path.dirname(self.path) or ".", ".precompute.lock")):
+            self.load()
+            if not force and not self.is_stale():
+                print(f"⚡ Precomputed answers for index {self.index_version} were written by another worker")
+                return
+            self._refresh(pipeline, questions)
+
+    def _refresh(self, pipeline, questions: List[str]):
+        print(f"⚡ Precomputing answers for {len(questions)} questions...")
+        answers = {}
+        for question in questions:
+            key = normalize_question(question)
+            if not key or key in answers:
+                continue
+            # Fresh retrieval: cached results may predate the index this store is tagged with
+            result = pipeline.query(question, self.k, use_cache=False)
+            if result.get("error"):
+                print(f"⚠️  Skipping '{question}': generation failed")
+                continue
+            answers[key] = {
+                "question": question,
+                "answer": result["answer"],
+                "sources": result["sources"],
+                "scores": result.get("scores", [])
+            }
+
+        if questions and not answers:
+            # Leave the store stale so the next load retries instead of serving nothing until re-ingestion
+            print("⚠️  No answers could be generated, keeping the store marked stale")
+            return
+
+        data = {
+            "index_version": self.index_version,
+            "generated_at": datetime.now().isoformat(),
+            "k": self.k,
+            "answers": answers
+        }
+        fd, tmp_path = tempfile.mkstemp(prefix=".precomputed-", dir=os.path.dirname(self.path) or ".")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+        self.answers = answers
+        self.stored_version = self.index_version
+        print(f"✅ Saved {len(answers)} precomputed answers to {self.path}")
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["entries"] = len(self.answers)
+        stats["index_version"] = self.index_version
+        stats["stale"] = self.is_stale()
+        return stats
+
+class QueryLog:
+    """Append-only log of context-free questions, used to pick the top queries to precompute"""
+
+    def __init__(self, path: str = "models/query_log.jsonl"):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def record(self, question: str):
+        entry = json.dumps({"question": question, "timestamp": datetime.now().isoformat()}, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(entry + "\n")
+
+    def top_questions(self, n: int) -> List[str]:
+        """Most frequent logged questions, most common first, by normalized form"""
+        if n <= 0 or not os.path.exists(self.path):
+            return []
+        counts = Counter()
+        first_seen = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    question = json.loads(line)["question"]
+                except (ValueError, KeyError):
+                    continue
+                key = normalize_question(question)
+                counts[key] += 1
+                first_seen.setdefault(key, question)
+        return [first_seen[key] for key, _ in counts.most_common(n)]
+
+def precompute_questions(query_log: QueryLog, top_n: int = 20) -> List[str]:
+    """Sample questions shown in the UI plus the most frequent logged queries"""
+    return list(SAMPLE_QUESTIONS) + query_log.top_questions(top_n)
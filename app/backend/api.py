@@ -1,18 +1,28 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Any
+import json
 import os
 from dotenv import load_dotenv
-import pickle
-import numpy as np
 import sys
 import uuid
-from datetime import datetime
+from datetime import datetime, date
+from starlette.concurrency import run_in_threadpool
+from app.backend.answer_store import normalize_question
+from app.backend.coalescing import SingleFlight
+from app.backend.admission import AdmissionController, Overloaded
+from app.backend.index_registry import IndexRegistry, UnknownCollection, DEFAULT_COLLECTION, collection_path
+from app.backend.ingestion_jobs import IngestionJobManager
+from app.retrieval.metadata import FilterError
+from app.resources import configure_threads, configure_request_threads
 
 # Load environment variables
 load_dotenv()
 
+# Size torch, OpenMP and executor threads before any model or index is loaded
+thread_budget = configure_threads()
+
 # Create FastAPI app instance
 app = FastAPI(
     title="HR RAG Chatbot API",
@@ -41,95 +51,157 @@ class ChatRequest(BaseModel):
     message: str
     conversation_id: Optional[str] = None
     chat_history: Optional[List[ChatMessage]] = []
+    include_history: Optional[bool] = True  # Clients tracking history locally can skip the echo
+    filters: Optional[Dict[str, Any]] = None  # Metadata filters, e.g. {"document": "HR-Policy", "page": {"gte": 3}}
+    collection: Optional[str] = None  # Tenant collection; the default collection when omitted
 
 class ChatResponse(BaseModel):
     response: str
     conversation_id: str
     sources: List[str]
     chat_history: List[ChatMessage]
+    cached: bool = False
 
 class QueryRequest(BaseModel):
     question: str
     k: Optional[int] = 3
+    filters: Optional[Dict[str, Any]] = None
+    collection: Optional[str] = None
+    client_id: Optional[str] = None  # Caller identity for fair queuing; without it requests are not capped per client
 
 class QueryResponse(BaseModel):
     question: str
     answer: str
     sources: List[str]
     scores: List[float]
+    cached: bool = False
+
+class UploadResponse(BaseModel):
+    job_id: str
+    status: str
+    collection: str
+    document: str
 
 # Global variables
-rag_pipeline = None
+rag_pipeline = None  # Mock pipeline when the real one cannot be loaded
+registry = None  # Per-collection pipelines once the default collection has loaded
 conversation_store = {}
+single_flight = SingleFlight()
+admission = AdmissionController(
+    max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", "4")),
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "32")),
+    max_queued_per_key=int(os.getenv("ADMISSION_MAX_QUEUED_PER_CONVERSATION", "2")),
+    max_wait=float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "20"))  # Below the client's 30s timeout
+)
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024)
+
+def reload_collection(collection_id: str):
+    """Swap a freshly ingested collection into the registry"""
+    if registry is not None:
+        registry.reload(collection_id)
+    else:
+        print(f"⚠️  Collection '{collection_id}' ingested, but RAG components are not available")
+
+ingestion = IngestionJobManager(
+    lambda collection_id: collection_path("models", collection_id),
+    upload_dir=os.path.join("data", "uploads"),
+    jobs_dir=os.path.join("data", "jobs"),
+    max_workers=int(os.getenv("INGESTION_WORKERS", "1")),
+    on_complete=reload_collection,
+    thread_budget=thread_budget
+)
+
+async def run_pipeline(admission_key: str, flight_key, fn, *args, **kwargs) -> Dict:
+    """Run LLM-bound pipeline work under admission control.
+
+    Joining an execution that is already in flight adds no load, so such
+    requests skip the queue. ``flight_key=None`` disables coalescing.
+    """
+    if flight_key is not None and single_flight.is_in_flight(flight_key):
+        return await single_flight.do(flight_key, fn, *args, **kwargs)
+    async with admission.slot(admission_key):
+        if flight_key is None:
+            return await run_in_threadpool(fn, *args, **kwargs)
+        return await single_flight.do(flight_key, fn, *args, **kwargs)
+
+async def resolve_collection(collection: Optional[str]):
+    """Return (pipeline, answer_store, query_log) for a collection, loading it on first use"""
+    if registry is None:
+        return rag_pipeline, None, None
+    try:
+        tenant = await run_in_threadpool(registry.get, collection)
+    except UnknownCollection as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return tenant.pipeline, tenant.answer_store, tenant.query_log
+
+def filter_key(filters: Optional[Dict]) -> str:
+    return json.dumps(filters, sort_keys=True) if filters else ""
+
+def overloaded_error(e: Overloaded) -> HTTPException:
+    return HTTPException(status_code=429, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
 
 # Simple RAG Pipeline for testing
 class MockRAGPipeline:
     def __init__(self):
         print("🤖 Mock RAG Pipeline initialized")
     
-    def chat(self, question: str, chat_history: List[Dict]) -> Dict:
+    def chat(self, question: str, chat_history: List[Dict], k: int = 3, conversation_id: Optional[str] = None,
+             filters: Optional[Dict] = None, use_cache: bool = True) -> Dict:
         return {
             "answer": f"This is a mock response to: '{question}'. The actual RAG system will process your HR policy questions.",
             "sources": ["HR Policy Document - Mock Source 1", "HR Policy Document - Mock Source 2"],
             "scores": [0.95, 0.87]
         }
     
-    def query(self, question: str, k: int = 3) -> Dict:
+    def query(self, question: str, k: int = 3, filters: Optional[Dict] = None, use_cache: bool = True) -> Dict:
         return self.chat(question, [])
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize the RAG pipeline on startup"""
-    global rag_pipeline
+    global rag_pipeline, registry
     print("🚀 Starting HR RAG Chatbot backend...")
+    configure_request_threads(thread_budget)
+    print(f"🧵 Thread budget: {thread_budget.to_dict()}")
     
     try:
-        # Try to load pre-processed embeddings
-        print("📁 Loading pre-processed embeddings...")
-        with open('models/embeddings.pkl', 'rb') as f:
-            data = pickle.load(f)
-            embeddings = data['embeddings']
-            chunks = data['chunks']
-        
-        print(f"📊 Loaded {len(chunks)} chunks with embeddings shape: {embeddings.shape}")
-        
-        # Import and initialize actual RAG components
+        # Import and initialize actual RAG components from pre-processed embeddings
+        from app.backend.rag_pipeline import build_rag_pipeline
+        # Fail at startup, not per request, when retrieval dependencies are missing
+        import app.retrieval.embeddings, app.retrieval.faiss_index
+        collections = IndexRegistry(
+            build_rag_pipeline,
+            models_dir="models",
+            memory_budget_bytes=int(float(os.getenv("INDEX_MEMORY_BUDGET_MB", "1024")) * 1024 * 1024),
+            idle_ttl=float(os.getenv("INDEX_IDLE_TTL_SECONDS", "1800")),
+            precompute_on_load=os.getenv("PRECOMPUTE_ON_STARTUP", "true").lower() == "true",
+            precompute_top_queries=int(os.getenv("PRECOMPUTE_TOP_QUERIES", "20"))
+        )
+        # Load the default collection eagerly; others load on first request
         try:
-            from app.retrieval.embeddings import EmbeddingGenerator
-            from app.retrieval.faiss_index import FAISSRetriever
-            from app.backend.rag_pipeline import RAGPipeline
-            
-            # Initialize retriever
-            print("🔍 Building FAISS index...")
-            embedder = EmbeddingGenerator()
-            retriever = FAISSRetriever()
-            retriever.model = embedder.model
-            retriever.build_index(embeddings, chunks)
-            
-            # Initialize RAG pipeline
-            print("🤖 Initializing RAG pipeline...")
-            groq_api_key = os.getenv("GROQ_API_KEY")
-            if not groq_api_key:
-                raise ValueError("GROQ_API_KEY environment variable not set")
-            
-            rag_pipeline = RAGPipeline(retriever, groq_api_key)
+            collections.get()
             print("✅ Actual RAG pipeline initialized successfully!")
-            
-        except ImportError as e:
-            print(f"⚠️  RAG components not available, using mock pipeline: {e}")
-            rag_pipeline = MockRAGPipeline()
-        except Exception as e:
-            print(f"⚠️  Error initializing RAG pipeline, using mock: {e}")
-            rag_pipeline = MockRAGPipeline()
+        except UnknownCollection as e:
+            # Tenant collections and uploads still work; default requests get a 404
+            print(f"⚠️  {e}, serving tenant collections only until documents are ingested")
+        # Evict idle collections and pick up artifacts published by ingestion jobs of other workers
+        collections.start_maintenance(float(os.getenv("INDEX_REFRESH_SECONDS", "10")))
+        registry = collections
         
-    except FileNotFoundError:
-        print("❌ Pre-processed embeddings not found. Using mock pipeline.")
+    except ImportError as e:
+        print(f"⚠️  RAG components not available, using mock pipeline: {e}")
         rag_pipeline = MockRAGPipeline()
     except Exception as e:
         print(f"❌ Error during startup: {e}")
         print("💡 Using mock pipeline for now...")
         rag_pipeline = MockRAGPipeline()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    ingestion.shutdown()
+    if registry is not None:
+        registry.stop_maintenance()
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -137,12 +209,15 @@ async def root():
     return {
         "message": "🤖 HR RAG Chatbot API", 
         "status": "running",
-        "rag_enabled": rag_pipeline is not None and not isinstance(rag_pipeline, MockRAGPipeline),
+        "rag_enabled": registry is not None,
         "endpoints": {
             "root": "GET /",
             "health": "GET /health",
             "chat": "POST /chat",
             "query": "POST /query",
+            "upload": "POST /documents",
+            "job": "GET /jobs/{job_id}",
+            "stats": "GET /stats",
             "docs": "GET /docs"
         },
         "usage": "Visit /docs for interactive API documentation"
@@ -156,25 +231,29 @@ async def health_check():
         "status": "healthy", 
         "service": "HR RAG Chatbot API",
         "timestamp": datetime.now().isoformat(),
-        "rag_enabled": rag_pipeline is not None and not isinstance(rag_pipeline, MockRAGPipeline)
+        "rag_enabled": registry is not None
     }
 
 # Chat endpoint
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
     """Chat endpoint with conversation memory"""
-    if rag_pipeline is None:
+    if rag_pipeline is None and registry is None:
         raise HTTPException(status_code=500, detail="RAG pipeline not initialized")
     
     try:
+        pipeline, answer_store, query_log = await resolve_collection(request.collection)
+        
         # Generate or use conversation ID
         conversation_id = request.conversation_id or str(uuid.uuid4())
         
         # Get or initialize chat history
-        if conversation_id not in conversation_store:
+        created = conversation_id not in conversation_store
+        if created:
             conversation_store[conversation_id] = []
         
         current_history = conversation_store[conversation_id]
+        is_context_free = not current_history
         
         # Add user message to history
         user_message = ChatMessage(
@@ -186,8 +265,28 @@ async def chat_endpoint(request: ChatRequest):
         
         print(f"💬 Processing chat: '{request.message}'")
         
-        # Generate response using RAG
-        result = rag_pipeline.chat(request.message, current_history)
+        # Serve precomputed answers directly, otherwise generate response using RAG
+        result = answer_store.lookup(request.message) if answer_store and not request.filters else None
+        cached = result is not None
+        if not cached:
+            # Identical concurrent first questions share one pipeline execution
+            flight_key = None
+            if is_context_free:
+                flight_key = ("chat", request.collection, normalize_question(request.message), filter_key(request.filters))
+            try:
+                result = await run_pipeline(
+                    conversation_id, flight_key,
+                    pipeline.chat, request.message, current_history,
+                    conversation_id=conversation_id, filters=request.filters
+                )
+            except (Overloaded, FilterError) as e:
+                current_history.remove(user_message)
+                if created and not current_history:
+                    # Rejected requests must not leave empty conversations behind
+                    conversation_store.pop(conversation_id, None)
+                raise overloaded_error(e) if isinstance(e, Overloaded) else HTTPException(status_code=400, detail=str(e))
+        if is_context_free and not request.filters and query_log:
+            query_log.record(request.message)
         
         # Add assistant response to history
         assistant_message = ChatMessage(
@@ -204,9 +303,12 @@ async def chat_endpoint(request: ChatRequest):
             response=result["answer"],
             conversation_id=conversation_id,
             sources=result["sources"],
-            chat_history=current_history
+            chat_history=current_history if request.include_history else [],
+            cached=cached
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error in chat endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error in chat: {str(e)}")
@@ -215,20 +317,116 @@ async def chat_endpoint(request: ChatRequest):
 @app.post("/query", response_model=QueryResponse)
 async def query_hr_policy(request: QueryRequest):
     """Simple query endpoint"""
-    if rag_pipeline is None:
+    if rag_pipeline is None and registry is None:
         raise HTTPException(status_code=500, detail="RAG pipeline not initialized")
     
     try:
-        result = rag_pipeline.query(request.question, request.k)
+        pipeline, answer_store, query_log = await resolve_collection(request.collection)
+        result = answer_store.lookup(request.question, request.k) if answer_store and not request.filters else None
+        cached = result is not None
+        if not cached:
+            # Behind a proxy every request shares one client address, so only
+            # callers that identify themselves are capped per key
+            admission_key = f"query:{request.client_id}" if request.client_id else ("query", uuid.uuid4().hex)
+            result = await run_pipeline(
+                admission_key,
+                ("query", request.collection, normalize_question(request.question), request.k, filter_key(request.filters)),
+                pipeline.query, request.question, request.k, filters=request.filters
+            )
+        if not request.filters and query_log:
+            query_log.record(request.question)
         return QueryResponse(
             question=request.question,
             answer=result["answer"],
             sources=result["sources"],
-            scores=result.get("scores", [])
+            scores=result.get("scores", []),
+            cached=cached
         )
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
+# Document upload endpoint
+@app.post("/documents", response_model=UploadResponse, status_code=202)
+async def upload_document(
+    file: UploadFile = File(...),
+    collection: Optional[str] = Form(None),
+    entity: Optional[str] = Form(None),
+    effective_date: Optional[str] = Form(None)
+):
+    """Accept a PDF and queue it for background ingestion into a collection"""
+    collection = collection or DEFAULT_COLLECTION
+    try:
+        collection_path("models", collection)
+        if effective_date:
+            date.fromisoformat(effective_date)
+    except (UnknownCollection, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    filename = os.path.basename(file.filename or "document.pdf")
+    document = os.path.splitext(filename)[0]
+    job_id = ingestion.new_job_id()
+    path = ingestion.upload_path(job_id)
+    try:
+        size = 0
+        with open(path, 'wb') as out:
+            while True:
+                data = await file.read(1024 * 1024)
+                if not data:
+                    break
+                if size == 0 and not data.startswith(b"%PDF"):
+                    raise HTTPException(status_code=400, detail="Uploaded file is not a PDF")
+                size += len(data)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+                out.write(data)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
+    except HTTPException:
+        os.remove(path)
+        raise
+    
+    job = ingestion.submit(job_id, collection, document, filename, entity=entity, effective_date=effective_date)
+    print(f"📥 Queued ingestion job {job_id} for '{filename}' into collection '{collection}'")
+    return UploadResponse(job_id=job.job_id, status=job.status, collection=collection, document=document)
+
+# Ingestion job status endpoint
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Status, stage and progress of an ingestion job"""
+    status = ingestion.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return status
+
+# Stats endpoint
+@app.get("/stats")
+async def stats_endpoint():
+    """Runtime counters of the RAG pipeline"""
+    collections = {}
+    if registry is not None:
+        for collection_id, tenant in list(registry.resident.items()):
+            chunks = tenant.pipeline.retriever.chunks
+            collections[collection_id] = {
+                "retrieval": tenant.pipeline.get_stats(),
+                "answer_store": tenant.answer_store.get_stats(),
+                "chunk_store": chunks.memory_report() if hasattr(chunks, "memory_report") else {}
+            }
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "registry": registry.get_stats() if registry is not None else {},
+        "collections": collections,
+        "coalescing": single_flight.get_stats(),
+        "admission": admission.get_stats(),
+        "ingestion": ingestion.get_stats(),
+        "threads": thread_budget.to_dict()
+    }
+
 # Test endpoint
 @app.get("/test")
 async def test_endpoint():
@@ -242,7 +440,10 @@ async def test_endpoint():
             "/test",
             "/docs",
             "/chat",
-            "/query"
+            "/query",
+            "/documents",
+            "/jobs/{job_id}",
+            "/stats"
         ]
     }
 
@@ -0,0 +1,35 @@
+import asyncio
+from typing import Any, Callable, Dict, Hashable
+from starlette.concurrency import run_in_threadpool
+
+class SingleFlight:
+    """Share one in-flight execution between concurrent identical requests.
+
+    The first caller for a key runs the blocking function in the threadpool;
+    callers arriving while it runs await the same result instead of starting
+    their own. Results are shared, so callers must treat them as read-only.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.stats = {"executions": 0, "coalesced": 0}
+
+    async def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+        else:
+            future = asyncio.ensure_future(run_in_threadpool(fn, *args, **kwargs))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            self.stats["executions"] += 1
+        # A cancelled caller must not cancel the execution others are waiting on
+        return await asyncio.shield(future)
+
+    def is_in_flight(self, key: Hashable) -> bool:
+        return key in self._in_flight
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats)
+        stats["in_flight"] = len(self._in_flight)
+        return stats
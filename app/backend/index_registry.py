@@ -0,0 +1,232 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+from app.backend.answer_store import AnswerStore, QueryLog, precompute_questions
+from app.retrieval.artifacts import artifact_version
+
+DEFAULT_COLLECTION = "default"
+COLLECTION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+class UnknownCollection(LookupError):
+    """Raised when a collection id is invalid or has no artifacts on disk"""
+
+def collection_path(models_dir: str, collection_id: str) -> str:
+    """Artifact directory of a collection"""
+    if collection_id == DEFAULT_COLLECTION:
+        return models_dir
+    if not COLLECTION_ID_PATTERN.match(collection_id):
+        raise UnknownCollection(f"Invalid collection id '{collection_id}'")
+    return os.path.join(models_dir, "collections", collection_id)
+
+class TenantIndex:
+    """Resident pipeline, answer store and query log of one collection"""
+
+    def __init__(self, collection_id: str, directory: str, pipeline, answer_store: AnswerStore, query_log: QueryLog,
+                 version: Optional[str] = None):
+        self.collection_id = collection_id
+        self.directory = directory
+        self.version = version  # Artifact version on disk when loaded
+        self.pipeline = pipeline
+        self.answer_store = answer_store
+        self.query_log = query_log
+        self.memory = pipeline.retriever.memory_usage()
+        self.loaded_at = time.time()
+        self.last_used = time.monotonic()
+        self.requests = 0
+
+class IndexRegistry:
+    """Per-collection retrieval indexes, loaded on first use and kept in a memory-budgeted LRU.
+
+    The default collection lives in ``models_dir`` and every other collection
+    in ``models_dir/collections/<id>``, each with the artifacts written by
+    process_document.py. All collections share one embedding model. Indexes
+    idle for longer than ``idle_ttl`` seconds, or least recently used ones
+    beyond ``memory_budget_bytes``, are evicted; pinned collections never are.
+    """
+
+    def __init__(self, build_pipeline: Callable, models_dir: str = "models",
+                 memory_budget_bytes: int = 1 << 30, idle_ttl: float = 1800.0,
+                 pinned=(DEFAULT_COLLECTION,), precompute_on_load: bool = True, precompute_top_queries: int = 20):
+        self.build_pipeline = build_pipeline
+        self.models_dir = models_dir
+        self.memory_budget_bytes = memory_budget_bytes
+        self.idle_ttl = idle_ttl
+        self.pinned = set(pinned)
+        self.precompute_on_load = precompute_on_load
+        self.precompute_top_queries = precompute_top_queries
+        self.resident: "OrderedDict[str, TenantIndex]" = OrderedDict()
+        self.stats = {"loads": 0, "load_failures": 0, "evictions": 0, "hits": 0, "reloads": 0}
+        self.embedding_model = None
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._stopped = threading.Event()
+
+    def collection_dir(self, collection_id: str) -> str:
+        return collection_path(self.models_dir, collection_id)
+
+    def get(self, collection_id: Optional[str] = None) -> TenantIndex:
+        """Return the resident index of a collection, loading it on first use"""
+        collection_id = collection_id or DEFAULT_COLLECTION
+        with self._lock:
+            tenant = self._touch(collection_id)
+            load_lock = self._load_locks.setdefault(collection_id, threading.Lock())
+            self._evict(keep=collection_id)
+        if tenant is not None:
+            return tenant
+
+        # Only one thread loads a given collection; others wait and reuse it
+        with load_lock:
+            with self._lock:
+                tenant = self._touch(collection_id)
+            if tenant is None:
+                tenant = self._load(collection_id)
+                with self._lock:
+                    self.resident[collection_id] = tenant
+                    tenant.requests += 1
+                    self._evict(keep=collection_id)
+        return tenant
+
+    def reload(self, collection_id: Optional[str] = None) -> Optional[TenantIndex]:
+        """Rebuild a resident collection from its artifacts on disk and swap it in.
+
+        Requests keep being served by the old index while the new one builds,
+        and those already running finish on it. Collections that are not
+        resident pick up the new artifacts on their next load.
+        """
+        collection_id = collection_id or DEFAULT_COLLECTION
+        with self._lock:
+            if collection_id not in self.resident:
+                return None
+            load_lock = self._load_locks.setdefault(collection_id, threading.Lock())
+
+        with load_lock:
+            tenant = self._load(collection_id)
+            with self._lock:
+                previous = self.resident.get(collection_id)
+                if previous is not None:
+                    tenant.requests = previous.requests
+                self.resident[collection_id] = tenant
+                self.resident.move_to_end(collection_id)
+                self.stats["reloads"] += 1
+                self._evict(keep=collection_id)
+        return tenant
+
+    def reload_changed(self):
+        """Reload resident collections whose artifacts were switched to a new version on disk.
+
+        Ingestion jobs reload only the worker that ran them; other API
+        workers pick up the new version here.
+        """
+        with self._lock:
+            tenants = list(self.resident.items())
+        for collection_id, tenant in tenants:
+            if artifact_version(tenant.directory) != tenant.version:
+                try:
+                    self.reload(collection_id)
+                except Exception as e:
+                    print(f"❌ Reloading collection '{collection_id}' failed, keeping the loaded index: {e}")
+
+    def start_maintenance(self, interval: float = 10.0):
+        """Every ``interval`` seconds, evict idle collections and reload changed ones in a daemon thread"""
+        def run():
+            while not self._stopped.wait(interval):
+                # Evict first so idle collections are not reloaded just to be dropped
+                self.evict_idle()
+                self.reload_changed()
+
+        threading.Thread(target=run, name="index-registry", daemon=True).start()
+
+    def stop_maintenance(self):
+        self._stopped.set()
+
+    def _touch(self, collection_id: str) -> Optional[TenantIndex]:
+        tenant = self.resident.get(collection_id)
+        if tenant is not None:
+            self.resident.move_to_end(collection_id)
+            tenant.last_used = time.monotonic()
+            tenant.requests += 1
+            self.stats["hits"] += 1
+        return tenant
+
+    def _load(self, collection_id: str) -> TenantIndex:
+        directory = self.collection_dir(collection_id)
+        if not os.path.isdir(directory):
+            raise UnknownCollection(f"Collection '{collection_id}' not found")
+
+        print(f"📂 Loading collection '{collection_id}' from {directory}...")
+        # Read before loading: if the artifacts switch meanwhile, the next check reloads again
+        version = artifact_version(directory)
+        try:
+            pipeline = self.build_pipeline(directory, embedding_model=self.embedding_model)
+        except FileNotFoundError:
+            with self._lock:
+                self.stats["load_failures"] += 1
+            raise UnknownCollection(f"Collection '{collection_id}' has no processed documents")
+        except Exception:
+            with self._lock:
+                self.stats["load_failures"] += 1
+            raise
+        # Later collections reuse the embedding model loaded by the first one
+        self.embedding_model = pipeline.retriever.model
+
+        answer_store = AnswerStore(os.path.join(directory, "precomputed_answers.json"), pipeline.retriever.index_version)
+        query_log = QueryLog(os.path.join(directory, "query_log.jsonl"))
+        if answer_store.is_stale() and self.precompute_on_load:
+            # Rebuild precomputed answers in the background, e.g. after re-ingestion
+            questions = precompute_questions(query_log, self.precompute_top_queries)
+            threading.Thread(target=answer_store.refresh, args=(pipeline, questions), daemon=True).start()
+
+        tenant = TenantIndex(collection_id, directory, pipeline, answer_store, query_log, version)
+        with self._lock:
+            self.stats["loads"] += 1
+        print(f"✅ Collection '{collection_id}' resident ({tenant.memory['total_bytes'] / 1e6:.1f} MB)")
+        return tenant
+
+    def _evict(self, keep: Optional[str] = None):
+        """Evict idle collections, then least recently used ones until within the memory budget"""
+        now = time.monotonic()
+        for collection_id, tenant in list(self.resident.items()):
+            if collection_id not in self.pinned and collection_id != keep and now - tenant.last_used > self.idle_ttl:
+                self._drop(collection_id)
+
+        for collection_id in list(self.resident):
+            if self.resident_bytes() <= self.memory_budget_bytes:
+                break
+            if collection_id not in self.pinned and collection_id != keep:
+                self._drop(collection_id)
+
+    def _drop(self, collection_id: str):
+        # In-flight requests keep their reference; memory is freed once they finish
+        self.resident.pop(collection_id)
+        self.stats["evictions"] += 1
+        print(f"♻️  Evicted collection '{collection_id}'")
+
+    def evict_idle(self):
+        with self._lock:
+            self._evict()
+
+    def resident_bytes(self) -> int:
+        return sum(tenant.memory["total_bytes"] for tenant in self.resident.values())
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                **self.stats,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "resident_bytes": self.resident_bytes(),
+                "collections": {
+                    collection_id: {
+                        "memory": tenant.memory,
+                        "requests": tenant.requests,
+                        "idle_seconds": round(now - tenant.last_used, 1),
+                        "index_version": tenant.pipeline.retriever.index_version,
+                        "artifact_version": tenant.version,
+                        "pinned": collection_id in self.pinned
+                    }
+                    for collection_id, tenant in self.resident.items()
+                }
+            }
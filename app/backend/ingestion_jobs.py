@@ -0,0 +1,234 @@
+import os
+import re
+import json
+import time
+import uuid
+import tempfile
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Callable, Dict, Optional
+from app.ingestion.pipeline import prepare_document, embed_chunks, merge_into_collection
+from app.resources import ThreadBudget, configure_threads
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# Share of the job completed when each stage starts
+STAGE_PROGRESS = {
+    "queued": 0.0,
+    "extracting": 0.05,
+    "embedding": 0.3,
+    "merging": 0.8,
+    "loading": 0.9,
+    "completed": 1.0
+}
+
+class IngestionJob:
+    """State of one uploaded document on its way into a collection"""
+
+    def __init__(self, job_id: str, collection: str, document: str, filename: str, pdf_path: str,
+                 entity: Optional[str] = None, effective_date: Optional[str] = None):
+        self.job_id = job_id
+        self.collection = collection
+        self.document = document
+        self.filename = filename
+        self.pdf_path = pdf_path
+        self.entity = entity
+        self.effective_date = effective_date
+        self.status = "queued"
+        self.stage = "queued"
+        self.error = None
+        self.result = {}
+        self.created_at = datetime.now().isoformat()
+        self.finished_at = None
+        self.stage_seconds = {}
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "collection": self.collection,
+            "document": self.document,
+            "filename": self.filename,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": STAGE_PROGRESS.get(self.stage, 0.0),
+            "error": self.error,
+            "result": self.result,
+            "stage_seconds": self.stage_seconds,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+class IngestionJobManager:
+    """Run uploaded PDFs through ingestion in background worker processes.
+
+    Extraction, chunking, deduplication, embedding and the artifact merge run
+    in a process pool, so their CPU work and the GIL stay out of the API
+    process. Merges into a collection are serialized by a file lock, also
+    across API workers. When a job has published its artifacts,
+    ``on_complete(collection)`` swaps the new index into this worker; other
+    workers notice the new artifact version themselves. Job state is written
+    to ``jobs_dir`` so every worker can report it.
+    """
+
+    def __init__(self, collection_dir: Callable[[str], str], upload_dir: str = "data/uploads", jobs_dir: str = "data/jobs",
+                 max_workers: int = 1, on_complete: Optional[Callable[[str], None]] = None, max_jobs: int = 200,
+                 thread_budget: Optional[ThreadBudget] = None):
+        self.collection_dir = collection_dir
+        self.upload_dir = upload_dir
+        self.jobs_dir = jobs_dir
+        self.max_workers = max_workers
+        self.on_complete = on_complete
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "pool_restarts": 0}
+        self.thread_budget = thread_budget
+        self._processes = self._new_pool()
+        self._runner = ThreadPoolExecutor(max_workers, thread_name_prefix="ingestion")
+        self._lock = threading.Lock()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # Worker processes are spawned, not forked, so they don't inherit the server's threads,
+        # and run with the ingestion share of the thread budget
+        budget = self.thread_budget.for_ingestion(self.max_workers) if self.thread_budget else None
+        return ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=configure_threads, initargs=(budget,))
+
+    def _replace_pool(self, broken) -> ProcessPoolExecutor:
+        """Swap a pool whose worker died (e.g. out of memory) for a fresh one, once per broken pool"""
+        with self._lock:
+            if self._processes is broken:
+                self._processes = self._new_pool()
+                self.stats["pool_restarts"] += 1
+                broken.shutdown(wait=False, cancel_futures=True)
+                print("♻️  Ingestion worker process died, restarted the process pool")
+            return self._processes
+
+    def _in_process(self, fn, *args):
+        """Run a stage in a worker process, recovering the pool if a worker dies"""
+        with self._lock:
+            pool = self._processes
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            # Broken by another job's worker: this job runs on the fresh pool
+            pool = self._replace_pool(pool)
+            future = pool.submit(fn, *args)
+        try:
+            return future.result()
+        except BrokenProcessPool as e:
+            self._replace_pool(pool)
+            raise RuntimeError("Ingestion worker process died, e.g. out of memory on a large PDF") from e
+
+    def upload_path(self, job_id: str) -> str:
+        os.makedirs(self.upload_dir, exist_ok=True)
+        return os.path.join(self.upload_dir, f"{job_id}.pdf")
+
+    def new_job_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def submit(self, job_id: str, collection: str, document: str, filename: str,
+               entity: Optional[str] = None, effective_date: Optional[str] = None) -> IngestionJob:
+        """Queue ingestion of the PDF already saved at upload_path(job_id)"""
+        job = IngestionJob(job_id, collection, document, filename, self.upload_path(job_id), entity, effective_date)
+        with self._lock:
+            self.jobs[job_id] = job
+            self.stats["submitted"] += 1
+            self._prune()
+        self._save(job)
+        self._runner.submit(self._run, job)
+        return job
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        """State of a job submitted to any worker, None if unknown"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        try:
+            with open(os.path.join(self.jobs_dir, f"{job_id}.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save(self, job: IngestionJob):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{job.job_id}-", dir=self.jobs_dir)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(job.to_dict(), f)
+        os.replace(tmp_path, os.path.join(self.jobs_dir, f"{job.job_id}.json"))
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_jobs"""
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.done][:max(0, len(self.jobs) - self.max_jobs)]:
+            self.jobs.pop(job_id)
+            try:
+                os.remove(os.path.join(self.jobs_dir, f"{job_id}.json"))
+            except FileNotFoundError:
+                pass
+
+    def _set_stage(self, job: IngestionJob, stage: str, started: float) -> float:
+        now = time.perf_counter()
+        if job.stage != "queued":
+            job.stage_seconds[job.stage] = round(now - started, 3)
+        job.stage = stage
+        self._save(job)
+        return now
+
+    def _run(self, job: IngestionJob):
+        job.status = "running"
+        started = self._set_stage(job, "extracting", time.perf_counter())
+        try:
+            prepared = self._in_process(prepare_document, job.pdf_path, job.document,
+                                        job.entity, job.effective_date)
+            started = self._set_stage(job, "embedding", started)
+            embeddings = self._in_process(embed_chunks, prepared["chunks"])
+
+            started = self._set_stage(job, "merging", started)
+            merged = self._in_process(
+                merge_into_collection, self.collection_dir(job.collection), job.document,
+                embeddings, prepared["chunks"], prepared["records"], prepared["duplicates"]
+            )
+            started = self._set_stage(job, "loading", started)
+            if self.on_complete:
+                self.on_complete(job.collection)
+
+            job.result = {"pages": prepared["pages"], "dedup": prepared["stats"], **merged}
+            job.status = "completed"
+            self._set_stage(job, "completed", started)
+            os.remove(job.pdf_path)
+            print(f"✅ Ingested '{job.filename}' into collection '{job.collection}' "
+                  f"({merged['added_chunks']} chunks, {merged['total_chunks']} total)")
+        except Exception as e:
+            # The upload is kept for inspection
+            job.status = "failed"
+            job.error = str(e)
+            print(f"❌ Ingestion job {job.job_id} failed at {job.stage}: {e}")
+        finally:
+            job.finished_at = datetime.now().isoformat()
+            self._save(job)
+            with self._lock:
+                self.stats["completed" if job.status == "completed" else "failed"] += 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            active = [job for job in self.jobs.values() if not job.done]
+            return {
+                **self.stats,
+                "workers": self.max_workers,
+                "queued": sum(job.status == "queued" for job in active),
+                "running": sum(job.status == "running" for job in active)
+            }
+
+    def shutdown(self):
+        self._runner.shutdown(wait=False, cancel_futures=True)
+        self._processes.shutdown(wait=False, cancel_futures=True)
@@ -1,14 +1,28 @@
 import os
 from groq import Groq
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+from collections import OrderedDict
+import threading
 import re
+from app.retrieval.working_set import ConversationWorkingSet
+
+GENERATION_ERROR_PREFIX = "I apologize, but I'm having trouble generating a response right now."
 
 class RAGPipeline:
-    def __init__(self, retriever, groq_api_key: str):
+    def __init__(self, retriever, groq_api_key: str, reuse_threshold: float = 0.8,
+                 working_set_depth: int = 4, max_working_sets: int = 1000):
         self.retriever = retriever
         self.client = Groq(api_key=groq_api_key)
         print(f"✅ Groq client initialized with API key: {groq_api_key[:10]}...")
         
+        # Per-conversation retrieval working sets (LRU over conversations)
+        self.reuse_threshold = reuse_threshold
+        self.working_set_depth = working_set_depth  # Candidates kept per turn, as a multiple of k
+        self.max_working_sets = max_working_sets
+        self.working_sets = OrderedDict()
+        self.retrieval_stats = {"working_set_hits": 0, "working_set_misses": 0}
+        self._lock = threading.Lock()
+        
     def generate_chat_response(self, question: str, context_chunks: List[str], chat_history: List[Dict]) -> str:
         """Generate chat response using conversation history"""
         
@@ -61,14 +75,62 @@ HR ASSISTANT:"""
             
             return chat_completion.choices[0].message.content.strip()
         except Exception as e:
-            return f"I apologize, but I'm having trouble generating a response right now. Error: {str(e)}"
+            return f"{GENERATION_ERROR_PREFIX} Error: {str(e)}"
+    
+    def _get_working_set(self, conversation_id: str) -> ConversationWorkingSet:
+        """Get or create the working set of a conversation, evicting the least recently used"""
+        with self._lock:
+            working_set = self.working_sets.pop(conversation_id, None)
+            if working_set is None:
+                working_set = ConversationWorkingSet(similarity_threshold=self.reuse_threshold)
+            self.working_sets[conversation_id] = working_set
+            while len(self.working_sets) > self.max_working_sets:
+                self.working_sets.popitem(last=False)
+            return working_set
+    
+    def retrieve_for_conversation(self, question: str, conversation_id: str, k: int = 3,
+                                  use_cache: bool = True) -> List[Tuple[str, float]]:
+        """Retrieve chunks, reusing the conversation's recent candidates for close follow-ups"""
+        working_set = self._get_working_set(conversation_id)
+        query_embedding = self.retriever.encode_query(question)
+        candidate_ids = working_set.match(query_embedding)
+        
+        if candidate_ids is not None:
+            ids, scores = self.retriever.score_candidates(question, query_embedding, candidate_ids, k)
+            results = [(self.retriever.chunks[idx], float(score)) for idx, score in zip(ids, scores)]
+            stat = "working_set_hits"
+        else:
+            # Same top k as search(), cache included; the wider dense pool only seeds the working set
+            results = self.retriever.search(question, k=k, use_cache=use_cache, query_embedding=query_embedding)
+            candidate_ids, _ = self.retriever.retrieve(question, k * self.working_set_depth, mode="dense",
+                                                       query_embedding=query_embedding)
+            stat = "working_set_misses"
+        
+        working_set.add(query_embedding, candidate_ids)
+        with self._lock:
+            self.retrieval_stats[stat] += 1
+        return results
+    
+    def get_stats(self) -> Dict:
+        """Retrieval reuse and hybrid search counters"""
+        with self._lock:
+            stats = dict(self.retrieval_stats)
+            stats["active_working_sets"] = len(self.working_sets)
+        stats.update(self.retriever.get_stats())
+        lookups = stats["working_set_hits"] + stats["working_set_misses"]
+        stats["working_set_hit_rate"] = stats["working_set_hits"] / lookups if lookups else 0.0
+        return stats
     
-    def chat(self, question: str, chat_history: List[Dict], k: int = 3) -> Dict:
-        """Chat method with conversation history"""
+    def chat(self, question: str, chat_history: List[Dict], k: int = 3, conversation_id: Optional[str] = None,
+             filters: Optional[Dict] = None, use_cache: bool = True) -> Dict:
+        """Chat method with conversation history and optional metadata filters"""
         print(f"🔍 Searching for relevant information for: '{question}'")
         
-        # Retrieve relevant chunks
-        retrieved_chunks = self.retriever.search(question, k=k)
+        # Retrieve relevant chunks; filtered searches skip the conversation working set
+        if conversation_id and not filters:
+            retrieved_chunks = self.retrieve_for_conversation(question, conversation_id, k=k, use_cache=use_cache)
+        else:
+            retrieved_chunks = self.retriever.search(question, k=k, filters=filters, use_cache=use_cache)
         
         if not retrieved_chunks:
             return {
@@ -88,9 +150,51 @@ HR ASSISTANT:"""
         return {
             "answer": answer,
             "sources": chunks_text,
-            "scores": scores
+            "scores": scores,
+            "error": answer.startswith(GENERATION_ERROR_PREFIX)
         }
     
-    def query(self, question: str, k: int = 3) -> Dict:
+    def query(self, question: str, k: int = 3, filters: Optional[Dict] = None, use_cache: bool = True) -> Dict:
         """Simple query method (backward compatibility)"""
-        return self.chat(question, [], k)
\ No newline at end of file
+        return self.chat(question, [], k, filters=filters, use_cache=use_cache)
+
+def build_rag_pipeline(models_dir: str = 'models', embedding_model=None) -> RAGPipeline:
+    """Load pre-processed artifacts and build the retriever and pipeline from environment settings.
+    
+    Pass ``embedding_model`` to share one loaded SentenceTransformer between pipelines.
+    """
+    from app.retrieval.embeddings import EmbeddingGenerator
+    from app.retrieval.faiss_index import FAISSRetriever
+    from app.retrieval.artifacts import load_artifacts
+    
+    # Load pre-processed embeddings and chunks
+    print("📁 Loading pre-processed embeddings...")
+    embeddings, chunks, metadata = load_artifacts(models_dir)
+    
+    print(f"📊 Loaded {len(chunks)} chunks with embeddings shape: {embeddings.shape}")
+    if hasattr(chunks, "memory_report"):
+        report = chunks.memory_report()
+        print(f"🗜️  Chunk store maps {report['store_bytes']} bytes vs {report['list_of_str_bytes']} as a list of str")
+    
+    # Initialize retriever
+    print("🔍 Building FAISS index...")
+    if embedding_model is None:
+        embedding_model = EmbeddingGenerator().model
+    retriever = FAISSRetriever(
+        default_mode=os.getenv("RETRIEVAL_MODE", "rerank"),
+        latency_budget_ms=float(os.getenv("RETRIEVAL_LATENCY_BUDGET_MS", "250"))
+    )
+    retriever.model = embedding_model
+    retriever.build_index(embeddings, chunks, metadata)
+    
+    # Initialize RAG pipeline
+    print("🤖 Initializing RAG pipeline...")
+    groq_api_key = os.getenv("GROQ_API_KEY")
+    if not groq_api_key:
+        raise ValueError("GROQ_API_KEY environment variable not set")
+    
+    return RAGPipeline(
+        retriever,
+        groq_api_key,
+        reuse_threshold=float(os.getenv("RETRIEVAL_REUSE_THRESHOLD", "0.8"))
+    )
@@ -1,9 +1,16 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import time
 from datetime import datetime
 
+try:
+    from app.frontend.sample_questions import SAMPLE_QUESTIONS
+except ImportError:
+    # `streamlit run app/frontend/chat_ui.py` only puts this directory on the path
+    from sample_questions import SAMPLE_QUESTIONS
+
 # Configure the page - THIS MUST BE THE FIRST STREAMLIT COMMAND
 st.set_page_config(
     page_title="HR Policy Chatbot",
@@ -106,24 +113,40 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Number of most recent messages rendered on each rerun; older ones are paged in on demand
+MESSAGES_PER_PAGE = 20
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """Pooled keep-alive HTTP session shared across reruns and browser sessions"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
 class HRChatbot:
     def __init__(self, api_url: str = "http://localhost:8000"):
         self.api_url = api_url
+        self.session = get_http_session()
     
-    def send_message(self, message: str, chat_history: list):
-        """Send message to chat endpoint"""
+    def send_message(self, message: str):
+        """Send the new turn to the chat endpoint; the server keeps the history per conversation_id"""
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.api_url}/chat",
                 json={
                     "message": message,
                     "conversation_id": st.session_state.get('conversation_id'),
-                    "chat_history": chat_history
+                    "include_history": False
                 },
                 timeout=30
             )
             if response.status_code == 200:
                 return response.json()
+            elif response.status_code == 429:
+                retry_after = response.headers.get("Retry-After", "a few")
+                return {"error": f"⏳ The assistant is busy right now. Please try again in {retry_after} seconds."}
             else:
                 return {"error": f"API error: {response.status_code} - {response.text}"}
         except requests.exceptions.ConnectionError:
@@ -142,6 +165,9 @@ def initialize_session_state():
     if "auto_question" not in st.session_state:
         st.session_state.auto_question = ""
     
+    if "visible_messages" not in st.session_state:
+        st.session_state.visible_messages = MESSAGES_PER_PAGE
+    
     # Add welcome message if no messages exist
     if not st.session_state.messages:
         st.session_state.messages.append({
@@ -194,25 +220,13 @@ def main():
             st.session_state.messages = []
             st.session_state.conversation_id = None
             st.session_state.auto_question = ""
+            st.session_state.visible_messages = MESSAGES_PER_PAGE
             st.rerun()
         
         st.markdown("---")
         st.subheader("💡 Sample Questions")
         
-        sample_questions = [
-            "What is the maternity leave policy?",
-            "How many earned leaves do employees get per year?",
-            "What are the working hours and days?",
-            "Tell me about the dress code policy",
-            "How does the attendance system work?",
-            "What is the probation period for new employees?",
-            "Can you explain the leave policy?",
-            "What is the sexual harassment policy?",
-            "How are employee wages determined?",
-            "What is the code of conduct?"
-        ]
-        
-        for question in sample_questions:
+        for question in SAMPLE_QUESTIONS:
             if st.button(f"• {question}", key=question):
                 st.session_state.auto_question = question
                 st.rerun()
@@ -232,8 +246,16 @@ def main():
     chat_container = st.container()
     
     with chat_container:
+        # Only render the latest page of messages so rerun cost stays flat in long chats
+        messages = st.session_state.messages
+        hidden_count = max(0, len(messages) - st.session_state.visible_messages)
+        if hidden_count:
+            if st.button(f"⬆️ Show earlier messages ({hidden_count} hidden)", use_container_width=True):
+                st.session_state.visible_messages += MESSAGES_PER_PAGE
+                st.rerun()
+        
         # Display chat messages
-        for message in st.session_state.messages:
+        for message in messages[hidden_count:]:
             with st.chat_message(message["role"]):
                 display_chat_message(
                     message["role"], 
@@ -266,17 +288,8 @@ def main():
             message_placeholder = st.empty()
             message_placeholder.markdown("💭 Thinking...")
             
-            # Prepare chat history for API (exclude current message)
-            api_chat_history = []
-            for msg in st.session_state.messages[:-1]:  # All except the last (current) message
-                api_chat_history.append({
-                    "role": msg["role"],
-                    "content": msg["content"],
-                    "timestamp": msg.get("timestamp")
-                })
-            
             # Get response from API
-            response = chatbot.send_message(prompt, api_chat_history)
+            response = chatbot.send_message(prompt)
             
             if "error" in response:
                 error_message = f"❌ {response['error']}"
@@ -287,17 +300,21 @@ def main():
                 full_response = response["response"]
                 sources = response.get("sources", [])
                 
-                # Simulate streaming response
-                displayed_response = ""
-                message_placeholder.markdown("🔄 Processing...")
-                
-                # Typewriter effect
-                for char in full_response:
-                    displayed_response += char
-                    message_placeholder.markdown(displayed_response + "▌")
-                    time.sleep(0.01)  # Adjust speed as needed
-                
-                message_placeholder.markdown(displayed_response)
+                if response.get("cached"):
+                    # Precomputed answers are shown at once
+                    message_placeholder.markdown(full_response)
+                else:
+                    # Simulate streaming response
+                    displayed_response = ""
+                    message_placeholder.markdown("🔄 Processing...")
+                    
+                    # Typewriter effect
+                    for char in full_response:
+                        displayed_response += char
+                        message_placeholder.markdown(displayed_response + "▌")
+                        time.sleep(0.01)  # Adjust speed as needed
+                    
+                    message_placeholder.markdown(displayed_response)
                 
                 # Update conversation ID
                 st.session_state.conversation_id = response.get("conversation_id")
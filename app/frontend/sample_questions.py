@@ -0,0 +1,13 @@
+# Sidebar sample questions; answers to these are also precomputed by precompute_answers.py
+SAMPLE_QUESTIONS = [
+    "What is the maternity leave policy?",
+    "How many earned leaves do employees get per year?",
+    "What are the working hours and days?",
+    "Tell me about the dress code policy",
+    "How does the attendance system work?",
+    "What is the probation period for new employees?",
+    "Can you explain the leave policy?",
+    "What is the sexual harassment policy?",
+    "How are employee wages determined?",
+    "What is the code of conduct?"
+]
@@ -1,5 +1,5 @@
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from typing import List
+from typing import List, Dict, Tuple
 
 class TextChunker:
     def __init__(self, chunk_size: int = 512, chunk_overlap: int = 50):
@@ -12,4 +12,19 @@ class TextChunker:
     def chunk_text(self, text: str) -> List[str]:
         """Split text into chunks"""
         chunks = self.text_splitter.split_text(text)
-        return chunks
\ No newline at end of file
+        return chunks
+    
+    def chunk_pages(self, pages: List[Dict]) -> Tuple[List[str], List[Dict]]:
+        """Split each page into chunks and record the page and section of every chunk"""
+        chunks = []
+        records = []
+        section = None
+        for page in pages:
+            for chunk in self.chunk_text(page["text"]):
+                # The chunk belongs to the last heading it contains, else to the running section
+                for heading in page["headings"]:
+                    if heading and heading in chunk:
+                        section = heading
+                chunks.append(chunk)
+                records.append({"page": page["page"], "section": section})
+        return chunks, records
@@ -0,0 +1,129 @@
+import re
+import zlib
+import numpy as np
+from typing import List, Dict
+
+MERSENNE_PRIME = (1 << 61) - 1
+
+class ChunkDeduplicator:
+    """Collapse near-duplicate chunks using MinHash signatures and LSH banding.
+
+    Chunks whose word-shingle Jaccard similarity is at least ``threshold``
+    are grouped, and each group is replaced by one canonical chunk (the
+    longest member) that keeps back-references to the original chunk ids.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, bands: int = 16,
+                 shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+
+    def _shingles(self, text: str) -> np.ndarray:
+        """Hashed word n-grams of a chunk"""
+        words = re.findall(r'\w+', text.lower())
+        n = min(self.shingle_size, len(words)) or 1
+        grams = {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+        return np.unique(np.array([zlib.crc32(gram.encode()) for gram in grams], dtype=np.uint64))
+
+    def _signature(self, shingles: np.ndarray) -> np.ndarray:
+        """MinHash signature: min over shingles of (a * x + b) mod p for each permutation"""
+        hashed = (np.outer(self._a, shingles) + self._b[:, None]) % np.uint64(MERSENNE_PRIME)
+        return hashed.min(axis=1)
+
+    def _candidate_pairs(self, signatures: np.ndarray) -> set:
+        """Pairs of chunks sharing at least one identical LSH band"""
+        rows = self.num_perm // self.bands
+        pairs = set()
+        for band in range(self.bands):
+            buckets: Dict[bytes, List[int]] = {}
+            band_slice = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+            for idx, row in enumerate(band_slice):
+                buckets.setdefault(row.tobytes(), []).append(idx)
+            for members in buckets.values():
+                for i, first in enumerate(members):
+                    for second in members[i + 1:]:
+                        pairs.add((first, second))
+        return pairs
+
+    def deduplicate(self, chunks: List[str]) -> Dict:
+        """Group near-duplicates and return canonical chunks with back-references.
+
+        Returns a dict with ``chunks`` (canonical chunks in document order),
+        ``duplicates`` (for each canonical chunk, the original chunk ids it
+        stands for), ``representatives`` (the original chunk id whose text was
+        kept), ``canonical_ids`` (for each original chunk, the id of its
+        canonical chunk) and ``stats``.
+        """
+        if not chunks:
+            return {"chunks": [], "duplicates": [], "representatives": [], "canonical_ids": [],
+                    "stats": self._stats(0, 0)}
+
+        shingles = [self._shingles(chunk) for chunk in chunks]
+        signatures = np.vstack([self._signature(s) for s in shingles])
+
+        # Union-find over verified candidate pairs
+        parent = list(range(len(chunks)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for first, second in self._candidate_pairs(signatures):
+            intersection = len(np.intersect1d(shingles[first], shingles[second], assume_unique=True))
+            union = len(shingles[first]) + len(shingles[second]) - intersection
+            if union and intersection / union >= self.threshold:
+                parent[find(second)] = find(first)
+
+        groups: Dict[int, List[int]] = {}
+        for idx in range(len(chunks)):
+            groups.setdefault(find(idx), []).append(idx)
+
+        canonical_chunks = []
+        duplicates = []
+        representatives = []
+        canonical_ids = [0] * len(chunks)
+        # Groups are ordered by their first occurrence, keeping document order
+        for members in sorted(groups.values(), key=lambda m: m[0]):
+            representative = max(members, key=lambda i: len(chunks[i]))
+            for idx in members:
+                canonical_ids[idx] = len(canonical_chunks)
+            canonical_chunks.append(chunks[representative])
+            duplicates.append(members)
+            representatives.append(representative)
+
+        return {
+            "chunks": canonical_chunks,
+            "duplicates": duplicates,
+            "representatives": representatives,
+            "canonical_ids": canonical_ids,
+            "stats": self._stats(len(chunks), len(canonical_chunks))
+        }
+
+    def _stats(self, original: int, canonical: int) -> Dict:
+        return {
+            "original_chunks": original,
+            "canonical_chunks": canonical,
+            "collapsed_chunks": original - canonical,
+            "reduction": (original - canonical) / original if original else 0.0
+        }
+
+def canonical_records(records: List[Dict], dedup: Dict) -> List[Dict]:
+    """Metadata record per canonical chunk, listing the pages and sections of its whole group"""
+    canonical = []
+    for representative, members in zip(dedup["representatives"], dedup["duplicates"]):
+        record = dict(records[representative])
+        if len(members) > 1:
+            # Collapsed boilerplate must still match page and section filters of every copy
+            record["pages"] = sorted({records[i]["page"] for i in members if records[i].get("page")})
+            record["sections"] = sorted({records[i]["section"] for i in members if records[i].get("section")})
+        canonical.append(record)
+    return canonical
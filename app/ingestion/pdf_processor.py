@@ -25,6 +25,36 @@ class PDFProcessor:
         text = re.sub(r'[^\w\s.,!?;:()\-]', '', text)
         return text.strip()
     
+    def extract_pages(self, pdf_path: str) -> List[str]:
+        """Extract raw text of each page"""
+        with open(pdf_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            return [page.extract_text() or "" for page in pdf_reader.pages]
+    
+    def extract_headings(self, page_text: str) -> List[str]:
+        """Find section headings: short numbered or all-caps lines"""
+        headings = []
+        for line in page_text.splitlines():
+            line = line.strip()
+            if not 3 <= len(line) <= 80:
+                continue
+            numbered = re.match(r'^\d+(\.\d+)*[.)]?\s+[A-Z][\w ,&/()\-]{2,}$', line)
+            upper = line.isupper() and re.search(r'[A-Z]{3,}', line)
+            if numbered or upper:
+                headings.append(self.clean_text(line))
+        return headings
+    
+    def process_pages(self, pdf_path: str) -> List[Dict]:
+        """Cleaned text and section headings of each page"""
+        pages = []
+        for page_num, page_text in enumerate(self.extract_pages(pdf_path), start=1):
+            pages.append({
+                "page": page_num,
+                "text": self.clean_text(f"===== Page {page_num} =====\n{page_text}"),
+                "headings": self.extract_headings(page_text)
+            })
+        return pages
+    
     def process_hr_policy(self, pdf_path: str) -> str:
         """Main method to process HR policy PDF"""
         raw_text = self.extract_text_from_pdf(pdf_path)
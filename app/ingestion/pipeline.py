@@ -0,0 +1,93 @@
+import os
+import numpy as np
+from contextlib import contextmanager
+from typing import List, Dict, Optional
+from app.ingestion.pdf_processor import PDFProcessor
+from app.ingestion.chunking import TextChunker
+from app.ingestion.dedup import ChunkDeduplicator, canonical_records
+from app.retrieval.artifacts import file_lock
+
+# Ingestion stages for background jobs. Each function takes and returns only
+# picklable values so it can run in a worker process.
+
+_embedder = None
+
+def prepare_document(pdf_path: str, document: str, entity: Optional[str] = None,
+                     effective_date: Optional[str] = None) -> Dict:
+    """Extract, chunk and deduplicate a PDF into canonical chunks with metadata records"""
+    pages = PDFProcessor().process_pages(pdf_path)
+    if not any(page["text"] for page in pages):
+        raise ValueError("No text could be extracted from the PDF")
+
+    chunks, records = TextChunker(chunk_size=512, chunk_overlap=50).chunk_pages(pages)
+    for record in records:
+        record.update(document=document, entity=entity, effective_date=effective_date)
+
+    dedup = ChunkDeduplicator().deduplicate(chunks)
+    return {
+        "pages": len(pages),
+        "chunks": dedup["chunks"],
+        "records": canonical_records(records, dedup),
+        "duplicates": [{"document": document, "ids": ids} for ids in dedup["duplicates"]],
+        "stats": dedup["stats"]
+    }
+
+def embed_chunks(chunks: List[str]) -> np.ndarray:
+    """Embed chunks with a model loaded once per worker process"""
+    global _embedder
+    if _embedder is None:
+        from app.retrieval.embeddings import EmbeddingGenerator
+        _embedder = EmbeddingGenerator()
+    return _embedder.generate_embeddings(chunks)
+
+@contextmanager
+def collection_lock(directory: str):
+    """Serialize merges into a collection across threads and processes (API workers, ingestion pools)"""
+    with file_lock(os.path.join(directory, ".ingest.lock")):
+        yield
+
+def merge_into_collection(directory: str, document: str, embeddings: np.ndarray, chunks: List[str],
+                          records: List[Dict], duplicates: List[Dict]) -> Dict:
+    """Merge a document's chunks into a collection's artifacts and publish them as a new version.
+
+    Chunks previously ingested for the same document are replaced, so
+    re-uploading a revised policy does not leave stale text in the index.
+    The read-merge-write runs under the collection lock, so concurrent jobs
+    in any process never lose each other's documents.
+    """
+    with collection_lock(directory):
+        return _merge(directory, document, embeddings, chunks, records, duplicates)
+
+def _merge(directory: str, document: str, embeddings: np.ndarray, chunks: List[str],
+           records: List[Dict], duplicates: List[Dict]) -> Dict:
+    from app.retrieval.artifacts import load_artifacts, load_duplicates, save_artifacts
+    from app.retrieval.metadata import ChunkMetadata
+
+    merged_embeddings = [embeddings]
+    merged_chunks = list(chunks)
+    merged_duplicates = [{**entry, "document": document} for entry in duplicates]
+    merged_records = [{**record, "document": document} for record in records]
+    replaced = 0
+    if os.path.isdir(directory):
+        try:
+            old_embeddings, old_chunks, old_metadata = load_artifacts(directory)
+        except FileNotFoundError:
+            old_embeddings = None
+        if old_embeddings is not None:
+            old_records = old_metadata.to_records() if old_metadata is not None else [{} for _ in range(len(old_chunks))]
+            old_duplicates = load_duplicates(directory)
+            if old_duplicates is None or len(old_duplicates) != len(old_chunks):
+                old_duplicates = [{"document": record.get("document"), "ids": []} for record in old_records]
+            keep = [i for i, record in enumerate(old_records) if record.get("document") != document]
+            replaced = len(old_chunks) - len(keep)
+            # Existing chunks first, so ids of other documents do not move
+            merged_embeddings.insert(0, old_embeddings[keep])
+            merged_chunks[:0] = [old_chunks[i] for i in keep]
+            merged_records[:0] = [old_records[i] for i in keep]
+            merged_duplicates[:0] = [old_duplicates[i] for i in keep]
+
+    embeddings = np.vstack(merged_embeddings).astype(np.float32)
+    version = save_artifacts(directory, embeddings, merged_chunks, duplicates=merged_duplicates,
+                             metadata=ChunkMetadata.from_records(merged_records))
+    return {"total_chunks": len(merged_chunks), "added_chunks": len(chunks), "replaced_chunks": replaced,
+            "artifact_version": version}
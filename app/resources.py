@@ -0,0 +1,135 @@
+import os
+from typing import Dict, Optional
+
+def available_cpus() -> int:
+    """CPUs this process may run on (respects taskset/cgroup CPU affinity)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+class ThreadBudget:
+    """Per-process CPU thread budget for torch, FAISS/OpenMP and executor pools.
+
+    By default every library sizes its pool from the full core count, so with
+    several uvicorn workers (``WEB_CONCURRENCY``) the node is oversubscribed.
+    The budget splits ``CPU_BUDGET`` (default: the CPUs in this process's
+    affinity mask) across workers. Each worker's share is split between
+    background ingestion and queries, and the query part between torch
+    intra-op threads and FAISS OpenMP threads. Executor pools are sized from
+    the same split. Any count can be pinned with its environment variable.
+    """
+
+    def __init__(self, cpus: int, workers: int = 1, torch_threads: Optional[int] = None,
+                 faiss_threads: Optional[int] = None, search_threads: Optional[int] = None,
+                 request_threads: Optional[int] = None, ingestion_threads: Optional[int] = None,
+                 llm_slots: int = 4):
+        self.cpus = max(1, cpus)
+        self.workers = max(1, workers)
+        self.per_process = max(1, self.cpus // self.workers)
+        # Background ingestion gets a quarter of the share so uploads don't starve queries
+        self.ingestion_threads = ingestion_threads or max(1, self.per_process // 4)
+        query_share = max(1, self.per_process - self.ingestion_threads)
+        # Query encoding and FAISS scans alternate within a request, but run
+        # concurrently across requests: each gets half the query share
+        self.torch_threads = torch_threads or max(1, query_share // 2)
+        self.faiss_threads = faiss_threads or max(1, query_share // 2)
+        # Sparse legs of hybrid queries, next to dense search on the request thread
+        self.search_threads = search_threads or max(1, query_share // 2)
+        # Sync request work: CPU-bound retrieval for the query share, plus one
+        # thread per admitted LLM call, which mostly waits on the network
+        self.request_threads = request_threads or query_share + llm_slots
+
+    @classmethod
+    def from_env(cls) -> "ThreadBudget":
+        def env_int(name: str) -> Optional[int]:
+            value = os.getenv(name)
+            return int(value) if value else None
+
+        # OMP_NUM_THREADS exported by configure_threads (inherited by child
+        # processes) is not a user override
+        omp_threads = os.getenv("OMP_NUM_THREADS")
+        if omp_threads == os.getenv(_EXPORTED_OMP_MARKER):
+            omp_threads = None
+
+        return cls(
+            cpus=env_int("CPU_BUDGET") or available_cpus(),
+            workers=env_int("WEB_CONCURRENCY") or 1,
+            torch_threads=env_int("TORCH_THREADS"),
+            faiss_threads=env_int("FAISS_THREADS") or (int(omp_threads) if omp_threads else None),
+            search_threads=env_int("SEARCH_THREADS"),
+            request_threads=env_int("REQUEST_THREADS"),
+            ingestion_threads=env_int("INGESTION_THREADS"),
+            llm_slots=env_int("ADMISSION_MAX_CONCURRENT") or 4
+        )
+
+    @classmethod
+    def offline(cls) -> "ThreadBudget":
+        """Budget for single-process command-line tools: torch and FAISS each get every CPU"""
+        cpus = int(os.getenv("CPU_BUDGET") or 0) or available_cpus()
+        return cls(cpus, torch_threads=cpus, faiss_threads=cpus)
+
+    def for_ingestion(self, workers: int = 1) -> "ThreadBudget":
+        """Budget applied inside each of ``workers`` ingestion worker processes"""
+        threads = max(1, self.ingestion_threads // max(1, workers))
+        return ThreadBudget(threads, torch_threads=threads, faiss_threads=threads, search_threads=1,
+                            request_threads=1, ingestion_threads=threads)
+
+    def to_dict(self) -> Dict:
+        return {
+            "cpus": self.cpus,
+            "workers": self.workers,
+            "per_process": self.per_process,
+            "torch_threads": self.torch_threads,
+            "faiss_threads": self.faiss_threads,
+            "search_threads": self.search_threads,
+            "request_threads": self.request_threads,
+            "ingestion_threads": self.ingestion_threads
+        }
+
+_applied: Optional[ThreadBudget] = None
+_EXPORTED_OMP_MARKER = "THREAD_BUDGET_OMP_NUM_THREADS"
+
+def configure_threads(budget: Optional[ThreadBudget] = None) -> ThreadBudget:
+    """Apply a thread budget to this process once; later calls return the applied budget.
+
+    Call before the first torch or FAISS operation: OpenMP pools read
+    OMP_NUM_THREADS when they start, and torch only accepts interop thread
+    settings before its first parallel work.
+    """
+    global _applied
+    if _applied is not None:
+        return _applied
+    budget = budget or ThreadBudget.from_env()
+
+    # Inherited by libraries initialised later and by spawned worker processes
+    os.environ["OMP_NUM_THREADS"] = str(budget.faiss_threads)
+    os.environ[_EXPORTED_OMP_MARKER] = str(budget.faiss_threads)
+    os.environ["MKL_NUM_THREADS"] = str(budget.torch_threads)
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+    try:
+        import torch
+        torch.set_num_threads(budget.torch_threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # Already fixed by earlier parallel work
+    except ImportError:
+        pass
+    try:
+        import faiss
+        faiss.omp_set_num_threads(budget.faiss_threads)
+    except ImportError:
+        pass
+
+    _applied = budget
+    return budget
+
+def current_budget() -> ThreadBudget:
+    """Budget applied to this process, or the environment's budget (not applied) if none was"""
+    return _applied or ThreadBudget.from_env()
+
+def configure_request_threads(budget: ThreadBudget):
+    """Size the threadpool that runs sync FastAPI work; call from inside the event loop"""
+    import anyio.to_thread
+    anyio.to_thread.current_default_thread_limiter().total_tokens = budget.request_threads
@@ -0,0 +1,134 @@
+import os
+import json
+import uuid
+import pickle
+import shutil
+import tempfile
+import threading
+import numpy as np
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Tuple, Union, Optional
+from app.retrieval.chunk_store import ChunkStore
+from app.retrieval.metadata import ChunkMetadata
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only serialize threads within a process
+    fcntl = None
+
+EMBEDDINGS_FILE = "embeddings.npy"
+LEGACY_EMBEDDINGS_FILE = "embeddings.pkl"
+DUPLICATES_FILE = "chunk_duplicates.json"
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+KEEP_VERSIONS = 3
+
+def artifact_version(models_dir: str) -> Optional[str]:
+    """Artifact version a models directory points to, None for the flat legacy layout"""
+    try:
+        with open(os.path.join(models_dir, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def artifacts_dir(models_dir: str) -> str:
+    """Directory holding the current artifacts of a models directory"""
+    version = artifact_version(models_dir)
+    return os.path.join(models_dir, VERSIONS_DIR, version) if version else models_dir
+
+_thread_locks: Dict[str, threading.Lock] = {}
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive lock on ``path`` across threads and processes (API workers, ingestion pools)"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with _thread_locks.setdefault(os.path.abspath(path), threading.Lock()):
+        with open(path, 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _write_atomic(path: str, write, mode: str = 'w'):
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}-", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def save_artifacts(models_dir: str, embeddings: np.ndarray, chunks: List[str],
+                   duplicates: Optional[List[Dict]] = None, metadata: Optional[ChunkMetadata] = None) -> str:
+    """Write the serving artifacts as a new version and switch the models directory to it.
+
+    The embeddings array, memory-mappable chunk store, chunk metadata and
+    ``duplicates`` (per stored chunk, its document and the ids of the chunks
+    of that document it stood for before deduplication) are written into
+    ``versions/<version>``. Then the CURRENT pointer file is atomically
+    replaced. Readers resolve the pointer once, so they always load a
+    consistent set, and servers keep reading a memory-mapped old version
+    until they reload. The legacy pickle is kept next to CURRENT for tools
+    that still read it. Returns the new version.
+    """
+    versions_dir = os.path.join(models_dir, VERSIONS_DIR)
+    os.makedirs(versions_dir, exist_ok=True)
+    # Names sort chronologically, which _prune_versions relies on
+    version = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{uuid.uuid4().hex[:6]}"
+    staging_dir = tempfile.mkdtemp(prefix=".staging-", dir=versions_dir)
+    try:
+        np.save(os.path.join(staging_dir, EMBEDDINGS_FILE), embeddings)
+        ChunkStore.write(chunks, staging_dir)
+        if metadata is not None:
+            metadata.save(staging_dir)
+        if duplicates is not None:
+            with open(os.path.join(staging_dir, DUPLICATES_FILE), 'w', encoding='utf-8') as f:
+                json.dump({"duplicates": duplicates}, f)
+        os.rename(staging_dir, os.path.join(versions_dir, version))
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    # The single switch readers observe
+    _write_atomic(os.path.join(models_dir, CURRENT_FILE), lambda f: f.write(version))
+    _write_atomic(os.path.join(models_dir, LEGACY_EMBEDDINGS_FILE),
+                  lambda f: pickle.dump({'embeddings': embeddings, 'chunks': list(chunks)}, f), mode='wb')
+    _prune_versions(versions_dir, version)
+    return version
+
+def _prune_versions(versions_dir: str, current: str):
+    """Delete all but the newest KEEP_VERSIONS versions; mapped files stay readable until unmapped"""
+    versions = sorted(name for name in os.listdir(versions_dir) if not name.startswith("."))
+    for name in versions[:-KEEP_VERSIONS]:
+        if name != current:
+            shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+
+def load_artifacts(models_dir: str = "models") -> Tuple[np.ndarray, Union[ChunkStore, List[str]], Optional[ChunkMetadata]]:
+    """Load embeddings, chunks and metadata (None for legacy artifacts) of the current version.
+
+    The memory-mapped chunk store is preferred over the pickle.
+    """
+    directory = artifacts_dir(models_dir)
+    metadata = ChunkMetadata.load(directory) if ChunkMetadata.exists(directory) else None
+    embeddings_path = os.path.join(directory, EMBEDDINGS_FILE)
+    if os.path.exists(embeddings_path) and ChunkStore.exists(directory):
+        return np.load(embeddings_path), ChunkStore(directory), metadata
+
+    with open(os.path.join(directory, LEGACY_EMBEDDINGS_FILE), 'rb') as f:
+        data = pickle.load(f)
+    return data['embeddings'], data['chunks'], metadata
+
+def load_duplicates(models_dir: str = "models") -> Optional[List[Dict]]:
+    """Per stored chunk, its document and pre-deduplication chunk ids; None if not recorded"""
+    path = os.path.join(artifacts_dir(models_dir), DUPLICATES_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        duplicates = json.load(f)["duplicates"]
+    # Older artifacts stored bare id lists of a single document
+    return [entry if isinstance(entry, dict) else {"document": None, "ids": entry} for entry in duplicates]
@@ -0,0 +1,73 @@
+import os
+import sys
+import numpy as np
+from typing import Dict, Iterator, List
+
+class ChunkStore:
+    """Read-only chunk texts stored as one UTF-8 blob plus an offsets array.
+
+    Both files are memory-mapped, so worker processes share the OS page cache
+    instead of each holding a list of Python strings, and a chunk is only
+    decoded when it is looked up.
+    """
+
+    BLOB_FILE = "chunks.bin"
+    OFFSETS_FILE = "chunk_offsets.npy"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        # offsets[i]:offsets[i + 1] is the byte range of chunk i
+        self.offsets = np.load(os.path.join(directory, self.OFFSETS_FILE), mmap_mode='r')
+        blob_path = os.path.join(directory, self.BLOB_FILE)
+        if os.path.getsize(blob_path) > 0:
+            self.blob = np.memmap(blob_path, dtype=np.uint8, mode='r')
+        else:
+            self.blob = np.empty(0, dtype=np.uint8)
+        self._baseline_bytes = None
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        return all(os.path.exists(os.path.join(directory, name)) for name in (cls.BLOB_FILE, cls.OFFSETS_FILE))
+
+    @classmethod
+    def write(cls, chunks: List[str], directory: str):
+        """Write chunks as a blob and offsets array"""
+        encoded = [chunk.encode('utf-8') for chunk in chunks]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+
+        with open(os.path.join(directory, cls.BLOB_FILE), 'wb') as f:
+            for data in encoded:
+                f.write(data)
+        np.save(os.path.join(directory, cls.OFFSETS_FILE), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx) -> str:
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"chunk id {idx} out of range")
+        return self.blob[self.offsets[idx]:self.offsets[idx + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def raw_bytes(self) -> memoryview:
+        """Concatenated UTF-8 bytes of all chunks, without decoding"""
+        return memoryview(self.blob)
+
+    def memory_report(self) -> Dict:
+        """Mapped size of the store against the same chunks held as a list of str"""
+        if self._baseline_bytes is None:
+            self._baseline_bytes = sys.getsizeof([None] * len(self)) + sum(sys.getsizeof(chunk) for chunk in self)
+        store_bytes = self.blob.nbytes + self.offsets.nbytes
+        return {
+            "chunks": len(self),
+            "store_bytes": store_bytes,
+            "list_of_str_bytes": self._baseline_bytes,
+            "savings_ratio": 1 - store_bytes / self._baseline_bytes if self._baseline_bytes else 0.0
+        }
@@ -1,23 +1,153 @@
-from typing import List   # ✅ Add this
+from typing import List, Optional
 from sentence_transformers import SentenceTransformer
 import numpy as np
 import pickle
+import time
 import os
 
+class AdaptiveBatchSizer:
+    """Tune the encode batch size from measured throughput, per token-length bucket.
+
+    Throughput depends on chunk length as much as on batch size, so sizes are
+    only compared on batches from the same power-of-two length bucket. Within
+    a bucket the batch size doubles while tokens/sec keeps improving by at
+    least ``min_gain``, then settles on the best size found. Exploration also
+    stops once ``target_tokens_per_sec`` is reached, or when the
+    ``max_batch_tokens`` padded-token cap prevents a larger batch. The first
+    measurement is discarded as model warm-up.
+    """
+
+    def __init__(self, initial: int = 32, min_size: int = 4, max_size: int = 256,
+                 max_batch_tokens: int = 16384, min_gain: float = 0.05,
+                 target_tokens_per_sec: Optional[float] = None):
+        self.batch_size = initial
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_batch_tokens = max_batch_tokens
+        self.min_gain = min_gain
+        self.target_tokens_per_sec = target_tokens_per_sec
+        self.buckets = {}
+        self.warmed_up = False
+
+    def _bucket(self, max_length: int) -> dict:
+        """Exploration state of a length bucket; new buckets start at the last settled size"""
+        key = max(1, max_length).bit_length()
+        if key not in self.buckets:
+            self.buckets[key] = {"size": self.batch_size, "best_size": self.batch_size,
+                                 "best_throughput": 0.0, "exploring": True}
+        return self.buckets[key]
+
+    def _cap(self, max_length: int) -> int:
+        return max(self.min_size, self.max_batch_tokens // max(1, max_length))
+
+    def size_for(self, max_length: int) -> int:
+        """Batch size for the next batch, whose longest chunk has max_length tokens"""
+        return max(self.min_size, min(self._bucket(max_length)["size"], self._cap(max_length)))
+
+    def record(self, size: int, max_length: int, tokens: int, seconds: float):
+        """Record the throughput of a batch of ``size`` chunks (the size actually encoded)"""
+        if seconds <= 0:
+            return
+        if not self.warmed_up:
+            self.warmed_up = True
+            return
+        state = self._bucket(max_length)
+        if not state["exploring"]:
+            return
+        if size < state["size"] and size < self._cap(max_length):
+            return  # Tail batch of the bucket, not the size under test
+        throughput = tokens / seconds
+        if throughput >= state["best_throughput"] * (1 + self.min_gain):
+            state["best_throughput"] = throughput
+            state["best_size"] = size
+            target_reached = self.target_tokens_per_sec and throughput >= self.target_tokens_per_sec
+            if size < state["size"] or size >= self.max_size or target_reached:
+                state["exploring"] = False
+            else:
+                state["size"] = min(self.max_size, size * 2)
+        else:
+            # No worthwhile gain from the larger batch
+            state["exploring"] = False
+        if not state["exploring"]:
+            state["size"] = state["best_size"]
+            self.batch_size = state["best_size"]
+
 class EmbeddingGenerator:
     def __init__(self, model_name: str = 'all-MiniLM-L6-v2'):
         self.model = SentenceTransformer(model_name)
         self.embeddings = None
         self.chunks = []
-    
-    def generate_embeddings(self, chunks: List[str]) -> np.ndarray:
-        """Generate embeddings for text chunks"""
+        self.last_profile = {}
+
+    def _token_lengths(self, chunks: List[str]) -> np.ndarray:
+        """Token count of each chunk as the model will see it (truncated to max_seq_length)"""
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is None:
+            return np.array([len(chunk.split()) for chunk in chunks])
+        encoded = tokenizer(chunks, truncation=True, max_length=self.model.max_seq_length)
+        return np.array([len(ids) for ids in encoded["input_ids"]])
+
+    def generate_embeddings(self, chunks: List[str], batch_size: int = 32, adaptive: bool = True,
+                            target_tokens_per_sec: Optional[float] = None) -> np.ndarray:
+        """Generate embeddings for text chunks.
+
+        Chunks are encoded longest first so each batch holds chunks of similar
+        token length and little padding; with ``adaptive`` the batch size is
+        tuned from measured throughput, up to ``target_tokens_per_sec``
+        (default: ``EMBED_TARGET_TOKENS_PER_SEC``, unset means no target).
+        Embeddings are returned in input order.
+        """
+        if target_tokens_per_sec is None and os.getenv("EMBED_TARGET_TOKENS_PER_SEC"):
+            target_tokens_per_sec = float(os.getenv("EMBED_TARGET_TOKENS_PER_SEC"))
         self.chunks = chunks
         print(f"🔄 Generating embeddings for {len(chunks)} chunks...")
-        self.embeddings = self.model.encode(chunks, show_progress_bar=True, batch_size=32)
-        print(f"✅ Embeddings generated with shape: {self.embeddings.shape}")
+        start = time.perf_counter()
+
+        lengths = self._token_lengths(chunks)
+        order = np.argsort(-lengths, kind="stable")
+        sizer = AdaptiveBatchSizer(initial=batch_size, target_tokens_per_sec=target_tokens_per_sec) if adaptive else None
+
+        embeddings = None
+        batches = 0
+        padded_tokens = 0
+        position = 0
+        while position < len(order):
+            max_length = int(lengths[order[position]])
+            size = sizer.size_for(max_length) if sizer else batch_size
+            batch = order[position:position + size]
+
+            batch_start = time.perf_counter()
+            batch_embeddings = self.model.encode([chunks[i] for i in batch], batch_size=len(batch),
+                                                 show_progress_bar=False, convert_to_numpy=True)
+            if sizer:
+                sizer.record(len(batch), max_length, int(lengths[batch].sum()), time.perf_counter() - batch_start)
+
+            if embeddings is None:
+                embeddings = np.zeros((len(chunks), batch_embeddings.shape[1]), dtype=batch_embeddings.dtype)
+            embeddings[batch] = batch_embeddings
+            batches += 1
+            padded_tokens += len(batch) * max_length
+            position += len(batch)
+
+        if embeddings is None:
+            embeddings = np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        elapsed = time.perf_counter() - start
+        total_tokens = int(lengths.sum())
+        self.last_profile = {
+            "chunks": len(chunks),
+            "batches": batches,
+            "seconds": elapsed,
+            "chunks_per_sec": len(chunks) / elapsed if elapsed else 0.0,
+            "tokens_per_sec": total_tokens / elapsed if elapsed else 0.0,
+            "padding_ratio": 1 - total_tokens / padded_tokens if padded_tokens else 0.0,
+            "final_batch_size": sizer.batch_size if sizer else batch_size
+        }
+        self.embeddings = embeddings
+        print(f"✅ Embeddings generated with shape: {self.embeddings.shape} "
+              f"({self.last_profile['chunks_per_sec']:.1f} chunks/sec, batch size {self.last_profile['final_batch_size']})")
         return self.embeddings
-    
+
     def save_embeddings(self, save_path: str):
         """Save embeddings and chunks"""
         if self.embeddings is not None:
@@ -2,83 +2,284 @@ import faiss
 import numpy as np
 from rank_bm25 import BM25Okapi
 import re
-from typing import List, Tuple, Dict
+import sys
+from typing import List, Tuple, Dict, Optional, Sequence
 import hashlib
 import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import redis
+from app.retrieval.metadata import ChunkMetadata, FilterError
+from app.resources import current_budget
+
+SEARCH_MODES = ("dense", "rerank", "hybrid")
 
 class FAISSRetriever:
-    def __init__(self, dimension: int = 384):
+    def __init__(self, dimension: int = 384, default_mode: str = "rerank",
+                 latency_budget_ms: float = 250.0, sparse_weight: float = 0.5, candidate_multiplier: int = 10):
+        if default_mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{default_mode}', expected one of {SEARCH_MODES}")
         self.dimension = dimension
         self.index = None
+        self.model = None
         self.chunks = []
+        self.metadata = None
         self.bm25_index = None
+        self.index_version = None
+        # Hybrid search settings
+        self.default_mode = default_mode
+        self.latency_budget_ms = latency_budget_ms
+        self.sparse_weight = sparse_weight
+        self.candidate_multiplier = candidate_multiplier
+        # Sparse retrieval of hybrid queries runs beside the caller's dense search, within the process thread budget
+        self.thread_budget = current_budget()
+        self._executor = ThreadPoolExecutor(max_workers=self.thread_budget.search_threads, thread_name_prefix="hybrid-search")
+        self._sparse_slots = threading.BoundedSemaphore(self.thread_budget.search_threads)
+        self.stats = {"sparse_skipped": 0, "sparse_timeouts": 0}
+        self._stats_lock = threading.Lock()
         # Initialize cache
         self.redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
-    
-    def build_index(self, embeddings: np.ndarray, chunks: List[str]):
-        """Build FAISS index"""
+
+    def build_index(self, embeddings: np.ndarray, chunks: Sequence[str], metadata: Optional[ChunkMetadata] = None):
+        """Build FAISS index over a list of chunks or a ChunkStore, with optional chunk metadata for filtering"""
         self.chunks = chunks
+        self.metadata = metadata
+        self.index_version = self._compute_index_version(embeddings, chunks)
         self.index = faiss.IndexFlatIP(embeddings.shape[1])
         # Normalize embeddings for cosine similarity
         faiss.normalize_L2(embeddings)
         self.index.add(embeddings)
-        
-        # Build BM25 index for re-ranking
+
+        # Build BM25 index for re-ranking and sparse retrieval
         tokenized_chunks = [self._tokenize(chunk) for chunk in chunks]
         self.bm25_index = BM25Okapi(tokenized_chunks)
-    
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Approximate resident bytes of the index structures"""
+        if hasattr(self.chunks, "memory_report"):
+            chunk_bytes = self.chunks.memory_report()["store_bytes"]
+        else:
+            chunk_bytes = sum(sys.getsizeof(chunk) for chunk in self.chunks)
+        usage = {
+            "faiss_bytes": self.index.ntotal * self.index.d * 4 if self.index is not None else 0,
+            "chunk_bytes": chunk_bytes,
+            "bm25_bytes": sum(sys.getsizeof(freqs) for freqs in self.bm25_index.doc_freqs) if self.bm25_index else 0,
+            "metadata_bytes": sum(column.nbytes for column in self.metadata.columns.values()) if self.metadata else 0
+        }
+        usage["total_bytes"] = sum(usage.values())
+        return usage
+
+    def _compute_index_version(self, embeddings: np.ndarray, chunks: Sequence[str]) -> str:
+        """Fingerprint of the indexed corpus, used to invalidate artifacts derived from it"""
+        digest = hashlib.md5(np.ascontiguousarray(embeddings).tobytes())
+        if hasattr(chunks, "raw_bytes"):
+            # Same digest as hashing each chunk, without decoding the chunk store
+            digest.update(chunks.raw_bytes())
+        else:
+            for chunk in chunks:
+                digest.update(chunk.encode())
+        return digest.hexdigest()[:16]
+
     def _tokenize(self, text: str) -> List[str]:
         """Simple tokenization for BM25"""
         return re.findall(r'\w+', text.lower())
-    
-    def _get_cache_key(self, query: str) -> str:
-        """Generate cache key for query"""
-        return hashlib.md5(query.encode()).hexdigest()
-    
-    def search(self, query: str, k: int = 5, rerank: bool = True) -> List[Tuple[str, float]]:
-        """Search with caching and optional re-ranking"""
-        
+
+    def _get_cache_key(self, query: str, k: int, mode: str, filters: Optional[Dict] = None) -> str:
+        """Generate cache key for query, scoped to the indexed corpus so collections never share entries"""
+        filter_key = json.dumps(filters, sort_keys=True) if filters else ""
+        return hashlib.md5(f"{self.index_version}:{mode}:{k}:{filter_key}:{query}".encode()).hexdigest()
+
+    def search(self, query: str, k: int = 5, rerank: bool = True, mode: Optional[str] = None,
+               use_cache: bool = True, filters: Optional[Dict] = None,
+               query_embedding: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """Search with caching and the selected retrieval mode.
+
+        Modes: "dense" (FAISS only), "rerank" (BM25 re-orders the dense
+        candidates) and "hybrid" (full dense and sparse retrieval fused with
+        normalized-score fusion). Without an explicit mode, ``rerank=False``
+        selects dense search and otherwise the retriever's default mode is used.
+        ``filters`` restricts both dense and sparse retrieval to chunks whose
+        metadata matches (see ChunkMetadata). Pass ``query_embedding`` when
+        the query is already encoded.
+        """
+        if mode is None:
+            mode = self.default_mode if rerank else "dense"
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}', expected one of {SEARCH_MODES}")
+
         # Check cache first
-        cache_key = self._get_cache_key(query)
-        cached_result = self.redis_client.get(cache_key)
-        if cached_result:
-            return json.loads(cached_result)
-        
-        # FAISS search
+        cache_key = self._get_cache_key(query, k, mode, filters)
+        if use_cache:
+            cached_result = self.redis_client.get(cache_key)
+            if cached_result:
+                return json.loads(cached_result)
+
+        ids, scores = self.retrieve(query, k, mode, query_embedding=query_embedding, filters=filters)
+        results = [(self.chunks[idx], float(score)) for idx, score in zip(ids, scores)]
+
+        # Cache the results
+        if use_cache:
+            self.redis_client.setex(cache_key, 3600, json.dumps(results))  # Cache for 1 hour
+        return results
+
+    def retrieve(self, query: str, k: int, mode: Optional[str] = None,
+                 query_embedding: Optional[np.ndarray] = None,
+                 filters: Optional[Dict] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Uncached search over the corpus (or its filtered subset) returning chunk ids and scores"""
+        mode = mode or self.default_mode
+        selection = self._select(filters)
+        if selection is not None and len(selection[1]) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        if mode == "hybrid":
+            return self._hybrid_search(query, k, query_embedding, selection)
+
+        ids, scores = self._dense_search(query, k * 2, query_embedding, selection)  # Get more for re-ranking
+        if mode == "rerank" and self.bm25_index:
+            ids, scores = self._rerank_with_bm25(query, ids, scores)
+        return ids[:k], scores[:k]
+
+    def score_candidates(self, query: str, query_embedding: np.ndarray, candidate_ids: np.ndarray,
+                         k: int, mode: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Rank a known candidate set instead of the whole corpus"""
+        mode = mode or self.default_mode
+        candidate_ids = np.asarray(candidate_ids, dtype=np.int64)
+        dense_scores = self._dense_scores(query_embedding, candidate_ids)
+        order = np.argsort(-dense_scores, kind="stable")
+        ids, scores = candidate_ids[order], dense_scores[order]
+
+        if mode == "rerank" and self.bm25_index:
+            ids, scores = self._rerank_with_bm25(query, ids, scores)
+        elif mode == "hybrid" and self.bm25_index:
+            return self._score_fusion(query, query_embedding, ids, k)
+        return ids[:k], scores[:k]
+
+    def _dense_scores(self, query_embedding: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        """Cosine similarity of the query to the given chunks"""
+        return self.index.reconstruct_batch(ids) @ query_embedding.reshape(-1)
+
+    def _select(self, filters: Optional[Dict]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Resolve filters to a packed id bitmap and the matching chunk ids"""
+        if not filters:
+            return None
+        if self.metadata is None:
+            raise FilterError("Metadata filters are not available for this index, re-run ingestion")
+        bitmap = self.metadata.select(filters)
+        return bitmap, self.metadata.ids(bitmap)
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """Encode and normalize a query for cosine similarity"""
         query_embedding = self.model.encode([query])
         faiss.normalize_L2(query_embedding)
-        distances, indices = self.index.search(query_embedding, k*2)  # Get more for re-ranking
-        
-        results = []
-        for idx, distance in zip(indices[0], distances[0]):
-            if idx < len(self.chunks):
-                results.append((self.chunks[idx], float(distance)))
-        
-        # Re-rank with BM25
-        if rerank and self.bm25_index:
-            reranked_results = self._rerank_with_bm25(query, results)
-            results = reranked_results[:k]
+        return query_embedding
+
+    def _dense_search(self, query: str, n: int, query_embedding: Optional[np.ndarray] = None,
+                      selection: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """FAISS search returning chunk ids and similarities in rank order"""
+        if query_embedding is None:
+            query_embedding = self.encode_query(query)
+        params = None
+        if selection is not None:
+            # Filter inside the scan so the top n are taken from matching chunks only
+            bitmap = selection[0]
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap)))
+        distances, indices = self.index.search(query_embedding, n, params=params)
+        valid = (indices[0] >= 0) & (indices[0] < len(self.chunks))
+        return indices[0][valid], distances[0][valid]
+
+    def _sparse_search(self, query: str, n: int,
+                       selection: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """BM25 search over the corpus (or only the selected chunks) returning chunk ids and scores in rank order"""
+        tokens = self._tokenize(query)
+        if selection is None:
+            ids = None
+            bm25_scores = self.bm25_index.get_scores(tokens)
         else:
-            results = results[:k]
-        
-        # Cache the results
-        self.redis_client.setex(cache_key, 3600, json.dumps(results))  # Cache for 1 hour
-        return results
-    
-    def _rerank_with_bm25(self, query: str, initial_results: List[Tuple[str, float]]) -> List[Tuple[str, float]]:
-        """Re-rank results using BM25"""
-        bm25_scores = self.bm25_index.get_scores(self._tokenize(query))
-        
-        combined_results = []
-        for chunk, faiss_score in initial_results:
-            chunk_idx = self.chunks.index(chunk)
-            bm25_score = bm25_scores[chunk_idx] if chunk_idx < len(bm25_scores) else 0
-            
-            # Combine scores (you can adjust weights)
-            combined_score = 0.7 * faiss_score + 0.3 * (bm25_score / 10)  # Normalize BM25 score
-            combined_results.append((chunk, combined_score))
-        
+            ids = selection[1]
+            bm25_scores = np.asarray(self.bm25_index.get_batch_scores(tokens, ids.tolist()))
+        top = self._top_n(bm25_scores, n)
+        # Chunks sharing no term with the query carry no sparse evidence
+        top = top[bm25_scores[top] > 0]
+        return (top if ids is None else ids[top]), bm25_scores[top]
+
+    def _top_n(self, scores: np.ndarray, n: int) -> np.ndarray:
+        """Indices of the n highest scores, best first"""
+        n = min(n, len(scores))
+        if n <= 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-scores, n - 1)[:n]
+        return top[np.argsort(-scores[top], kind="stable")]
+
+    def _hybrid_search(self, query: str, k: int, query_embedding: Optional[np.ndarray] = None,
+                       selection: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Fuse dense retrieval with sparse retrieval that finishes within the latency budget.
+
+        Dense results are required, so they are computed on the calling
+        thread. The sparse leg runs on the executor only when one of its
+        threads is free: under load it is skipped instead of queued, so no
+        request waits behind other requests' BM25 scoring.
+        """
+        if query_embedding is None:
+            query_embedding = self.encode_query(query)
+        n = min(len(self.chunks), k * self.candidate_multiplier)
+        sparse = None
+        if self._sparse_slots.acquire(blocking=False):
+            deadline = time.perf_counter() + self.latency_budget_ms / 1000
+            sparse = self._executor.submit(self._sparse_search, query, n, selection)
+            # The slot is held until the leg finishes, even if this request stops waiting for it
+            sparse.add_done_callback(lambda _: self._sparse_slots.release())
+        else:
+            self._count("sparse_skipped")
+
+        dense_ids, dense_scores = self._dense_search(query, n, query_embedding, selection)
+        if sparse is not None:
+            try:
+                sparse_ids, _ = sparse.result(timeout=max(0.0, deadline - time.perf_counter()))
+            except FutureTimeoutError:
+                self._count("sparse_timeouts")
+                print(f"⚠️  sparse retrieval exceeded the {self.latency_budget_ms:.0f}ms budget, fusing without it")
+            else:
+                # Union of both candidate lists, dense order first for stable ties
+                candidates = np.fromiter(dict.fromkeys(np.concatenate([dense_ids, sparse_ids]).tolist()), dtype=np.int64)
+                return self._score_fusion(query, query_embedding, candidates, k)
+        return dense_ids[:k], dense_scores[:k]
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def get_stats(self) -> Dict:
+        """Hybrid search counters: sparse legs skipped under load or dropped at the latency budget"""
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def _score_fusion(self, query: str, query_embedding: np.ndarray, candidate_ids: np.ndarray,
+                      k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Fuse normalized scores: (1 - sparse_weight) * cosine + sparse_weight * BM25 / best BM25.
+
+        Every candidate of either leg is scored on both, so a chunk that only
+        BM25 ranks first (an exact clause number or act name the embedding
+        misses) keeps its full keyword score and can outrank chunks that are
+        merely found by both legs.
+        """
+        dense_scores = self._dense_scores(query_embedding, candidate_ids)
+        bm25_scores = np.asarray(self.bm25_index.get_batch_scores(self._tokenize(query), candidate_ids.tolist()))
+        best = bm25_scores.max() if len(bm25_scores) else 0.0
+        sparse_scores = bm25_scores / best if best > 0 else np.zeros_like(bm25_scores)
+        fused = ((1 - self.sparse_weight) * dense_scores + self.sparse_weight * sparse_scores).astype(np.float32)
+
+        order = np.argsort(-fused, kind="stable")[:k]
+        return candidate_ids[order], fused[order]
+
+    def _rerank_with_bm25(self, query: str, ids: np.ndarray, faiss_scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Re-rank dense candidates using BM25"""
+        # Only the candidates need BM25 scores
+        bm25_scores = np.asarray(self.bm25_index.get_batch_scores(self._tokenize(query), ids.tolist()))
+
+        # Combine scores (you can adjust weights)
+        combined_scores = 0.7 * faiss_scores + 0.3 * (bm25_scores / 10)  # Normalize BM25 score
+
         # Sort by combined score
-        combined_results.sort(key=lambda x: x[1], reverse=True)
-        return combined_results
\ No newline at end of file
+        order = np.argsort(-combined_scores, kind="stable")
+        return ids[order], combined_scores[order]
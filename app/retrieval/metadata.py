@@ -0,0 +1,233 @@
+import os
+import numpy as np
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+CATEGORICAL_COLUMNS = ("document", "entity", "section")
+NUMERIC_COLUMNS = ("page", "effective_date")
+# Columns that may hold several values per chunk, e.g. boilerplate collapsed
+# from many pages; the record keys listing all values of a chunk
+MULTI_VALUED_COLUMNS = {"section": "sections", "page": "pages"}
+RANGE_OPERATORS = ("eq", "gt", "gte", "lt", "lte", "in")
+MISSING = np.iinfo(np.int32).min
+
+class FilterError(ValueError):
+    """Raised for malformed metadata filter expressions"""
+
+class ChunkMetadata:
+    """Per-chunk metadata in columnar arrays with bitmap indexes for filtering.
+
+    Categorical columns (document, entity, section) are stored as int32 codes
+    into a vocabulary, with one packed bitmap per value. Numeric columns
+    (page, effective_date as days since epoch) are plain int32 arrays. Filter
+    expressions evaluate to a packed bitmap usable as a FAISS ID selector.
+    Sections and pages of chunks collapsed into one by deduplication are kept
+    as extra (chunk id, value) pairs, so a chunk matches if any of its values
+    does.
+
+    Filter syntax, all keys combined with AND::
+
+        {"document": "HR-Policy"}                       # equality
+        {"entity": ["Entity A", "Entity B"]}            # any of
+        {"page": {"gte": 3, "lte": 10}}                 # range
+        {"effective_date": {"lte": "2024-06-01"}}       # ISO dates
+    """
+
+    FILE = "chunk_metadata.npz"
+
+    def __init__(self, columns: Dict[str, np.ndarray], vocabularies: Dict[str, List[str]],
+                 extras: Optional[Dict[str, Tuple[np.ndarray, np.ndarray]]] = None):
+        self.columns = columns
+        self.vocabularies = vocabularies
+        # Per multi-valued column: chunk ids and their additional values (codes for sections)
+        self.extras = {name: extras[name] if extras and name in extras
+                       else (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32))
+                       for name in MULTI_VALUED_COLUMNS}
+        self._codes = {name: {value: code for code, value in enumerate(vocab)}
+                       for name, vocab in vocabularies.items()}
+        self._bitmaps = {name: [self._pack(self._has_code(name, code)) for code in range(len(vocab))]
+                         for name, vocab in vocabularies.items()}
+
+    def _has_code(self, name: str, code: int) -> np.ndarray:
+        mask = self.columns[name] == code
+        if name in self.extras:
+            ids, codes = self.extras[name]
+            mask[ids[codes == code]] = True
+        return mask
+
+    def __len__(self) -> int:
+        return len(self.columns["page"])
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> "ChunkMetadata":
+        """Build columns from one dict per chunk; missing fields are allowed.
+
+        ``sections`` and ``pages`` list all values of a chunk that stands for
+        several collapsed chunks; ``section`` and ``page`` are its primary ones.
+        """
+        columns, vocabularies, lookups = {}, {}, {}
+        for name in CATEGORICAL_COLUMNS:
+            values = [record.get(name) or "" for record in records]
+            all_values = set(values)
+            if name in MULTI_VALUED_COLUMNS:
+                all_values.update(value for record in records for value in record.get(MULTI_VALUED_COLUMNS[name]) or [] if value)
+            vocab = sorted(all_values)
+            lookups[name] = {value: code for code, value in enumerate(vocab)}
+            columns[name] = np.array([lookups[name][value] for value in values], dtype=np.int32)
+            vocabularies[name] = vocab
+        columns["page"] = np.array([record.get("page") or MISSING for record in records], dtype=np.int32)
+        columns["effective_date"] = np.array([cls._to_days(record.get("effective_date")) for record in records],
+                                             dtype=np.int32)
+
+        extras = {}
+        for name, key in MULTI_VALUED_COLUMNS.items():
+            convert = lookups[name].get if name == "section" else int
+            pairs = [(i, convert(value)) for i, record in enumerate(records)
+                     for value in dict.fromkeys(record.get(key) or []) if value and value != record.get(name)]
+            extras[name] = (np.array([i for i, _ in pairs], dtype=np.int32),
+                            np.array([value for _, value in pairs], dtype=np.int32))
+        return cls(columns, vocabularies, extras)
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        records = []
+        for i in range(len(self)):
+            record = {name: self.vocabularies[name][self.columns[name][i]] or None for name in CATEGORICAL_COLUMNS}
+            page = int(self.columns["page"][i])
+            days = int(self.columns["effective_date"][i])
+            record["page"] = None if page == MISSING else page
+            record["effective_date"] = None if days == MISSING else date.fromordinal(days + date(1970, 1, 1).toordinal()).isoformat()
+            records.append(record)
+
+        for name, key in MULTI_VALUED_COLUMNS.items():
+            for i, value in zip(*self.extras[name]):
+                record = records[i]
+                if key not in record:
+                    record[key] = [record[name]] if record[name] is not None else []
+                record[key].append(self.vocabularies[name][value] if name == "section" else int(value))
+        return records
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, cls.FILE))
+
+    def save(self, directory: str):
+        arrays = dict(self.columns)
+        for name, vocab in self.vocabularies.items():
+            arrays[f"{name}_vocab"] = np.array(vocab, dtype=str)
+        for name, (ids, values) in self.extras.items():
+            arrays[f"{name}_extra_ids"] = ids
+            arrays[f"{name}_extra_values"] = values
+        np.savez(os.path.join(directory, self.FILE), **arrays)
+
+    @classmethod
+    def load(cls, directory: str) -> "ChunkMetadata":
+        with np.load(os.path.join(directory, cls.FILE)) as data:
+            columns = {name: data[name] for name in CATEGORICAL_COLUMNS + NUMERIC_COLUMNS}
+            vocabularies = {name: data[f"{name}_vocab"].tolist() for name in CATEGORICAL_COLUMNS}
+            # Metadata written before multi-valued columns has no extras
+            extras = {name: (data[f"{name}_extra_ids"], data[f"{name}_extra_values"])
+                      for name in MULTI_VALUED_COLUMNS if f"{name}_extra_ids" in data.files}
+        return cls(columns, vocabularies, extras)
+
+    @staticmethod
+    def _to_days(value) -> int:
+        """Days since epoch for an ISO date string or date, MISSING for None"""
+        if value is None or value == "":
+            return MISSING
+        if isinstance(value, str):
+            try:
+                value = date.fromisoformat(value[:10])
+            except ValueError:
+                raise FilterError(f"Invalid date '{value}', expected YYYY-MM-DD")
+        if not isinstance(value, date):
+            raise FilterError(f"Invalid date {value!r}, expected a YYYY-MM-DD string")
+        return value.toordinal() - date(1970, 1, 1).toordinal()
+
+    @staticmethod
+    def _to_page(value) -> int:
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            raise FilterError(f"Invalid page {value!r}, expected an integer")
+        try:
+            return int(value)
+        except ValueError:
+            raise FilterError(f"Invalid page {value!r}, expected an integer")
+
+    def _pack(self, mask: np.ndarray) -> np.ndarray:
+        # Little bit order matches faiss.IDSelectorBitmap: bit (i % 8) of byte i // 8
+        return np.packbits(mask, bitorder='little')
+
+    def select(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Evaluate a filter expression to a packed bitmap of matching chunk ids"""
+        if not filters:
+            return None
+        if not isinstance(filters, dict):
+            raise FilterError("Filters must be an object mapping field names to conditions")
+        bitmap = self._pack(np.ones(len(self), dtype=bool))
+        for name, condition in filters.items():
+            if name in CATEGORICAL_COLUMNS:
+                bitmap &= self._select_categorical(name, condition)
+            elif name in NUMERIC_COLUMNS:
+                bitmap &= self._pack(self._select_numeric(name, condition))
+            else:
+                raise FilterError(f"Unknown filter field '{name}', expected one of {CATEGORICAL_COLUMNS + NUMERIC_COLUMNS}")
+        return bitmap
+
+    def ids(self, bitmap: np.ndarray) -> np.ndarray:
+        """Chunk ids set in a packed bitmap"""
+        return np.flatnonzero(np.unpackbits(bitmap, count=len(self), bitorder='little'))
+
+    def _select_categorical(self, name: str, condition) -> np.ndarray:
+        if isinstance(condition, dict):
+            if not condition or set(condition) - {"eq", "in"}:
+                raise FilterError(f"Field '{name}' needs an 'eq' or 'in' condition")
+            if "in" in condition and not isinstance(condition["in"], list):
+                raise FilterError(f"'in' for field '{name}' expects a list")
+            condition = condition.get("in", condition.get("eq"))
+        values = condition if isinstance(condition, list) else [condition]
+        if not all(isinstance(value, str) for value in values):
+            raise FilterError(f"Field '{name}' expects a string or a list of strings")
+
+        bitmap = np.zeros((len(self) + 7) // 8, dtype=np.uint8)
+        for value in values:
+            code = self._codes[name].get(value)
+            if code is not None:
+                bitmap |= self._bitmaps[name][code]
+        return bitmap
+
+    def _select_numeric(self, name: str, condition) -> np.ndarray:
+        convert = self._to_days if name == "effective_date" else self._to_page
+        column = self.columns[name]
+        if not isinstance(condition, dict):
+            condition = {"in" if isinstance(condition, list) else "eq": condition}
+        if not condition:
+            raise FilterError(f"Field '{name}' has an empty condition, expected one of {RANGE_OPERATORS}")
+
+        mask = (column != MISSING) & self._compare(name, column, condition, convert)
+        if name in self.extras:
+            # A chunk matches when any one of its values satisfies the whole condition
+            ids, values = self.extras[name]
+            mask[ids[self._compare(name, values, condition, convert)]] = True
+        return mask
+
+    def _compare(self, name: str, values: np.ndarray, condition: Dict, convert) -> np.ndarray:
+        mask = np.ones(len(values), dtype=bool)
+        for op, value in condition.items():
+            if op not in RANGE_OPERATORS:
+                raise FilterError(f"Unknown operator '{op}' for field '{name}', expected one of {RANGE_OPERATORS}")
+            if op == "in":
+                if not isinstance(value, list):
+                    raise FilterError(f"'in' for field '{name}' expects a list")
+                mask &= np.isin(values, [convert(v) for v in value])
+                continue
+            value = convert(value)
+            if op == "eq":
+                mask &= values == value
+            elif op == "gt":
+                mask &= values > value
+            elif op == "gte":
+                mask &= values >= value
+            elif op == "lt":
+                mask &= values < value
+            elif op == "lte":
+                mask &= values <= value
+        return mask
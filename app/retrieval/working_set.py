@@ -0,0 +1,41 @@
+import threading
+import numpy as np
+from typing import Optional
+from collections import deque
+
+class ConversationWorkingSet:
+    """Recent query embeddings and candidate chunk ids for one conversation.
+
+    Follow-up questions whose embedding is close to a recent turn are answered
+    from the candidates of those turns instead of searching the whole corpus.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.8, max_turns: int = 4):
+        self.similarity_threshold = similarity_threshold
+        self.turns = deque(maxlen=max_turns)  # (normalized query embedding, candidate ids)
+        # Concurrent requests of one conversation read and append turns
+        self._lock = threading.Lock()
+
+    def match(self, query_embedding: np.ndarray) -> Optional[np.ndarray]:
+        """Return the candidate ids of all recent turns similar to the query, or None"""
+        with self._lock:
+            turns = list(self.turns)
+        if not turns:
+            return None
+
+        embeddings = np.vstack([embedding for embedding, _ in turns])
+        similarities = embeddings @ query_embedding.reshape(-1)
+        matched = [ids for (_, ids), similarity in zip(turns, similarities)
+                   if similarity >= self.similarity_threshold]
+        if not matched:
+            return None
+
+        # Union of candidates, keeping first-seen order
+        candidates = np.concatenate(matched)
+        _, first_seen = np.unique(candidates, return_index=True)
+        return candidates[np.sort(first_seen)]
+
+    def add(self, query_embedding: np.ndarray, candidate_ids: np.ndarray):
+        """Remember a turn's query embedding and the candidates it was answered from"""
+        with self._lock:
+            self.turns.append((query_embedding.reshape(-1), np.asarray(candidate_ids)))
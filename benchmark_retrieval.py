@@ -0,0 +1,185 @@
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import numpy as np
+
+# Add the app directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.retrieval.embeddings import EmbeddingGenerator
+from app.retrieval.faiss_index import FAISSRetriever, SEARCH_MODES
+from app.retrieval.artifacts import load_artifacts
+from app.retrieval.metadata import MISSING
+from app.resources import ThreadBudget, configure_threads
+from app.ingestion.dedup import ChunkDeduplicator
+from app.ingestion.pdf_processor import PDFProcessor
+from app.ingestion.chunking import TextChunker
+
+def build_queries(chunks, num_queries: int, window: int, seed: int):
+    """Build self-retrieval queries: a word window taken from a chunk must find that chunk"""
+    rng = random.Random(seed)
+    candidates = [i for i, chunk in enumerate(chunks) if len(chunk.split()) > window]
+    queries = []
+    for chunk_id in rng.sample(candidates, min(num_queries, len(candidates))):
+        words = chunks[chunk_id].split()
+        start = rng.randrange(len(words) - window)
+        queries.append((" ".join(words[start:start + window]), chunk_id))
+    return queries
+
+EXACT_TERM_PATTERNS = (
+    # Clause, section and rule references, e.g. "Clause 14.2", "Section 4(b)"
+    re.compile(r'\b(?:clause|section|rule|article|para(?:graph)?)\s+\d+(?:[.(]\w+\)?)*', re.IGNORECASE),
+    # Act names, e.g. "Payment of Gratuity Act, 1972"
+    re.compile(r'\b(?:[A-Z][a-z]+\s+(?:of\s+|and\s+)?){1,5}Act\b(?:,?\s+\d{4})?'),
+)
+
+def build_exact_term_queries(chunks, num_queries: int, seed: int):
+    """Build queries that are an exact term (clause number, act name) occurring in a single chunk.
+
+    Embeddings tend to miss such terms, so these queries expose whether
+    keyword evidence reaches the top k.
+    """
+    occurrences = {}
+    for chunk_id, chunk in enumerate(chunks):
+        for pattern in EXACT_TERM_PATTERNS:
+            for term in {match.group(0).strip() for match in pattern.finditer(chunk)}:
+                occurrences.setdefault(term.lower(), (term, set()))[1].add(chunk_id)
+    unique = sorted((term, next(iter(ids))) for term, ids in occurrences.values() if len(ids) == 1)
+    rng = random.Random(seed)
+    return rng.sample(unique, min(num_queries, len(unique)))
+
+def run_mode(retriever, queries, mode: str, k: int, canonical_ids=None):
+    """Return latency percentiles (ms), recall@k and MRR for one search mode.
+
+    ``canonical_ids`` maps the chunk a query was taken from to its chunk in a
+    deduplicated index.
+    """
+    latencies = []
+    hits = 0
+    reciprocal_ranks = 0.0
+    for query, chunk_id in queries:
+        start = time.perf_counter()
+        results = retriever.search(query, k=k, mode=mode, use_cache=False)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        retrieved = [chunk for chunk, score in results]
+        target = retriever.chunks[canonical_ids[chunk_id] if canonical_ids else chunk_id]
+        if target in retrieved:
+            hits += 1
+            reciprocal_ranks += 1.0 / (retrieved.index(target) + 1)
+
+    latencies = np.array(latencies)
+    return {
+        "p50": np.percentile(latencies, 50),
+        "p95": np.percentile(latencies, 95),
+        "p99": np.percentile(latencies, 99),
+        "recall": hits / len(queries),
+        "mrr": reciprocal_ranks / len(queries),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval latency and recall per search mode")
+    parser.add_argument("--models-dir", default="models")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--window", type=int, default=8, help="Words per synthetic query")
+    parser.add_argument("--budget-ms", type=float, default=250.0, help="Hybrid latency budget")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--filter-sweep", action="store_true",
+                        help="Measure latency under page filters of increasing selectivity")
+    parser.add_argument("--compare-dedup", action="store_true",
+                        help="Also measure recall before and after collapsing near-duplicate chunks")
+    parser.add_argument("--pdf", default="HR-Policy (1).pdf",
+                        help="Source PDF the pre-deduplication chunks are rebuilt from for --compare-dedup")
+    args = parser.parse_args()
+    configure_threads(ThreadBudget.offline())
+
+    embeddings, chunks, metadata = load_artifacts(args.models_dir)
+
+    embedder = EmbeddingGenerator()
+    retriever = FAISSRetriever(latency_budget_ms=args.budget_ms)
+    retriever.model = embedder.model
+    retriever.build_index(embeddings, chunks, metadata)
+
+    queries = build_queries(chunks, args.queries, args.window, args.seed)
+    print(f"📊 {len(queries)} queries over {len(chunks)} chunks, k={args.k}")
+
+    # Warm up the model and BM25 so the first mode is not penalised
+    for mode in SEARCH_MODES:
+        retriever.search(queries[0][0], k=args.k, mode=mode, use_cache=False)
+
+    print_table(retriever, queries, args.k)
+
+    exact_queries = build_exact_term_queries(chunks, args.queries, args.seed)
+    if exact_queries:
+        print(f"\n🔎 {len(exact_queries)} exact-term queries (clause numbers, act names)")
+        print_table(retriever, exact_queries, args.k)
+    else:
+        print("\n⚠️  No clause numbers or act names unique to one chunk, skipping exact-term queries")
+
+    if args.filter_sweep:
+        if metadata is None:
+            print("\n⚠️  No chunk metadata found, re-run process_document.py to enable the filter sweep")
+        else:
+            filter_sweep(retriever, queries, args.k)
+
+    if args.compare_dedup:
+        compare_dedup(args, embedder)
+
+def compare_dedup(args, embedder):
+    """Recall of the full pre-deduplication chunk set vs its deduplicated index.
+
+    Ingested artifacts only hold canonical chunks, so the original chunks are
+    rebuilt from the source PDF with the ingestion chunker settings.
+    """
+    if not os.path.exists(args.pdf):
+        print(f"\n⚠️  Source PDF '{args.pdf}' not found, pass --pdf to compare deduplication")
+        return
+    pages = PDFProcessor().process_pages(args.pdf)
+    chunks, _ = TextChunker(chunk_size=512, chunk_overlap=50).chunk_pages(pages)
+    embeddings = embedder.generate_embeddings(chunks)
+    queries = build_queries(chunks, args.queries, args.window, args.seed)
+
+    full = FAISSRetriever(latency_budget_ms=args.budget_ms)
+    full.model = embedder.model
+    full.build_index(embeddings, chunks)
+    print(f"\n📄 Before deduplication: {len(chunks)} chunks rebuilt from {args.pdf}")
+    print_table(full, queries, args.k)
+
+    dedup = ChunkDeduplicator().deduplicate(chunks)
+    stats = dedup["stats"]
+    print(f"\n🧹 After deduplication: {stats['canonical_chunks']} of {stats['original_chunks']} chunks "
+          f"({stats['reduction']:.1%} smaller)")
+    deduped = FAISSRetriever(latency_budget_ms=args.budget_ms)
+    deduped.model = embedder.model
+    deduped.build_index(embeddings[dedup["representatives"]], dedup["chunks"])
+    print_table(deduped, queries, args.k, dedup["canonical_ids"])
+
+def filter_sweep(retriever, queries, k: int):
+    """Latency per mode as a page filter keeps a shrinking share of the corpus"""
+    pages = retriever.metadata.columns["page"]
+    last_page = int(pages[pages != MISSING].max())
+    print(f"\n{'selected':>9} {'mode':<8} {'p50 ms':>8} {'p99 ms':>8}")
+    for fraction in (1.0, 0.5, 0.1, 0.01):
+        filters = {"page": {"lte": max(1, round(last_page * fraction))}}
+        selected = len(retriever.metadata.ids(retriever.metadata.select(filters)))
+        for mode in SEARCH_MODES:
+            latencies = []
+            for query, _ in queries:
+                start = time.perf_counter()
+                retriever.search(query, k=k, mode=mode, use_cache=False, filters=filters)
+                latencies.append((time.perf_counter() - start) * 1000)
+            print(f"{selected:>9} {mode:<8} {np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 99):>8.1f}")
+
+def print_table(retriever, queries, k: int, canonical_ids=None):
+    print(f"{'mode':<8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'recall@k':>9} {'MRR':>6}")
+    for mode in SEARCH_MODES:
+        stats = run_mode(retriever, queries, mode, k, canonical_ids)
+        print(f"{mode:<8} {stats['p50']:>8.1f} {stats['p95']:>8.1f} {stats['p99']:>8.1f} "
+              f"{stats['recall']:>9.3f} {stats['mrr']:>6.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the app directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.resources import ThreadBudget, available_cpus, configure_threads
+
+def parse_splits(value: str):
+    """Parse "workers x threads" pairs like "1x8,2x4,4x2"; threads apply to torch and FAISS"""
+    splits = []
+    for item in value.split(","):
+        workers, threads = item.lower().split("x")
+        splits.append((int(workers), int(threads)))
+    return splits
+
+def default_splits(cpus: int):
+    """For each worker count: one thread, the budgeted share, and every core (no budget)"""
+    splits = []
+    workers = 1
+    while workers <= cpus:
+        budget = ThreadBudget(cpus, workers)
+        for threads in sorted({1, budget.torch_threads, budget.per_process, cpus}):
+            splits.append((workers, threads))
+        workers *= 2
+    return splits
+
+def worker(models_dir: str, budget: ThreadBudget, mode: str, k: int, queries, clients: int, barrier, results):
+    """One API worker process: build the retriever under a thread budget and serve queries from client threads"""
+    configure_threads(budget)
+    from app.retrieval.embeddings import EmbeddingGenerator
+    from app.retrieval.faiss_index import FAISSRetriever
+    from app.retrieval.artifacts import load_artifacts
+
+    embeddings, chunks, metadata = load_artifacts(models_dir)
+    retriever = FAISSRetriever(default_mode=mode)
+    retriever.model = EmbeddingGenerator().model
+    retriever.build_index(embeddings, chunks, metadata)
+    for query in queries[:5]:
+        retriever.search(query, k=k, use_cache=False)
+
+    def timed_search(query: str) -> float:
+        start = time.perf_counter()
+        retriever.search(query, k=k, use_cache=False)
+        return (time.perf_counter() - start) * 1000
+
+    # All workers start sending load at the same time
+    barrier.wait()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        latencies = list(pool.map(timed_search, queries))
+    results.put((latencies, time.perf_counter() - start))
+
+def run_split(args, cpus: int, workers: int, threads: int, queries):
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    budget = ThreadBudget(cpus, workers, torch_threads=threads, faiss_threads=threads)
+    clients = max(1, -(-args.concurrency // workers))
+    processes = [
+        ctx.Process(target=worker, args=(args.models_dir, budget, args.mode, args.k,
+                                         queries[i::workers], clients, barrier, results))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = np.concatenate([latencies for latencies, _ in outcomes])
+    wall = max(seconds for _, seconds in outcomes)
+    return {
+        "qps": len(latencies) / wall,
+        "p50": np.percentile(latencies, 50),
+        "p99": np.percentile(latencies, 99)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval throughput and tail latency per thread budget split")
+    parser.add_argument("--models-dir", default="models")
+    parser.add_argument("--cpus", type=int, default=available_cpus(), help="Cores shared by all workers")
+    parser.add_argument("--splits", help='Comma-separated "workers x threads", e.g. "1x8,2x4,4x2"')
+    parser.add_argument("--concurrency", type=int, help="Concurrent clients across all workers (default 2 per core)")
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--window", type=int, default=8, help="Words per synthetic query")
+    parser.add_argument("--mode", default="rerank")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    args.concurrency = args.concurrency or 2 * args.cpus
+
+    from app.retrieval.artifacts import load_artifacts
+    from benchmark_retrieval import build_queries
+    _, chunks, _ = load_artifacts(args.models_dir)
+    queries = [query for query, _ in build_queries(chunks, args.queries, args.window, args.seed)]
+    splits = parse_splits(args.splits) if args.splits else default_splits(args.cpus)
+
+    print(f"📊 {len(queries)} '{args.mode}' queries from {args.concurrency} clients on {args.cpus} CPUs")
+    print(f"{'workers':>7} {'threads':>7} {'total':>6} {'qps':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    rows = []
+    for workers, threads in splits:
+        stats = run_split(args, args.cpus, workers, threads, queries)
+        rows.append((workers, threads, stats))
+        # total > cpus means the split oversubscribes the cores
+        print(f"{workers:>7} {threads:>7} {workers * threads:>6} {stats['qps']:>8.1f} "
+              f"{stats['p50']:>8.1f} {stats['p99']:>8.1f}")
+
+    best_qps = max(rows, key=lambda row: row[2]["qps"])
+    best_p99 = min(rows, key=lambda row: row[2]["p99"])
+    print(f"\n🏆 Highest throughput: WEB_CONCURRENCY={best_qps[0]} TORCH_THREADS={best_qps[1]} FAISS_THREADS={best_qps[1]}")
+    print(f"🏆 Lowest p99: WEB_CONCURRENCY={best_p99[0]} TORCH_THREADS={best_p99[1]} FAISS_THREADS={best_p99[1]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+
+# Add the app directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.backend.rag_pipeline import build_rag_pipeline
+from app.backend.answer_store import AnswerStore, QueryLog, precompute_questions
+from app.resources import ThreadBudget, configure_threads
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute answers for sample questions and the top logged queries")
+    parser.add_argument("--models-dir", default="models",
+                        help="Artifacts of the collection, e.g. models/collections/<id>")
+    parser.add_argument("--top-n", type=int, default=int(os.getenv("PRECOMPUTE_TOP_QUERIES", "20")),
+                        help="Number of most frequent logged queries to include")
+    args = parser.parse_args()
+
+    load_dotenv()
+    configure_threads(ThreadBudget.offline())
+    pipeline = build_rag_pipeline(args.models_dir)
+    query_log = QueryLog(os.path.join(args.models_dir, "query_log.jsonl"))
+    questions = precompute_questions(query_log, args.top_n)
+
+    store = AnswerStore(os.path.join(args.models_dir, "precomputed_answers.json"), pipeline.retriever.index_version)
+    store.refresh(pipeline, questions, force=True)
+
+if __name__ == "__main__":
+    main()
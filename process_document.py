@@ -1,75 +1,140 @@
 import os
 import sys
-import pickle
+import time
+import argparse
 import numpy as np
 from pathlib import Path
+from typing import Optional
 
 # Add the app directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.ingestion.pdf_processor import PDFProcessor
 from app.ingestion.chunking import TextChunker
+from app.ingestion.dedup import ChunkDeduplicator, canonical_records
+from app.ingestion.pipeline import collection_lock
+from app.resources import ThreadBudget, configure_threads
+from app.backend.index_registry import collection_path, UnknownCollection
 from app.retrieval.embeddings import EmbeddingGenerator
+from app.retrieval.artifacts import save_artifacts
+from app.retrieval.metadata import ChunkMetadata
 
-def process_hr_document():
+def process_hr_document(pdf_path: str = "HR-Policy (1).pdf", entity: Optional[str] = None,
+                        effective_date: Optional[str] = None, models_dir: str = "models", profile: bool = False):
     """Process the HR policy PDF and generate embeddings"""
+    timings = {}
+    started = time.perf_counter()
+    stage_start = started
+    
+    def end_stage(name: str):
+        nonlocal stage_start
+        now = time.perf_counter()
+        timings[name] = now - stage_start
+        stage_start = now
     
     # Create necessary directories
-    Path("models").mkdir(parents=True, exist_ok=True)
+    Path(models_dir).mkdir(parents=True, exist_ok=True)
     Path("data").mkdir(parents=True, exist_ok=True)
     
     # Check if PDF exists
-    pdf_path = "HR-Policy (1).pdf"
     if not os.path.exists(pdf_path):
         print(f"❌ Error: PDF file '{pdf_path}' not found!")
-        print("Please make sure 'HR-Policy (1).pdf' is in the project root directory")
+        print(f"Please make sure '{pdf_path}' exists, by default in the project root directory")
         return False
     
     print("📄 Step 1: Extracting text from PDF...")
     processor = PDFProcessor()
-    text = processor.process_hr_policy(pdf_path)
+    pages = processor.process_pages(pdf_path)
+    text_length = sum(len(page["text"]) for page in pages)
+    end_stage("extract")
     
-    if not text:
+    if not text_length:
         print("❌ Failed to extract text from PDF")
         return False
     
-    print(f"📊 Extracted {len(text)} characters of text")
+    print(f"📊 Extracted {text_length} characters of text from {len(pages)} pages")
     
     print("✂️ Step 2: Chunking text...")
     chunker = TextChunker(chunk_size=512, chunk_overlap=50)
-    chunks = chunker.chunk_text(text)
+    chunks, records = chunker.chunk_pages(pages)
+    
+    # Document-level metadata used by filtered search
+    document = Path(pdf_path).stem
+    for record in records:
+        record.update(document=document, entity=entity, effective_date=effective_date)
     
     print(f"📦 Created {len(chunks)} text chunks")
+    end_stage("chunk")
+    
+    print("🧹 Step 3: Collapsing near-duplicate chunks...")
+    dedup = ChunkDeduplicator().deduplicate(chunks)
+    chunks = dedup["chunks"]
+    metadata = ChunkMetadata.from_records(canonical_records(records, dedup))
+    stats = dedup["stats"]
+    print(f"📦 Kept {stats['canonical_chunks']} of {stats['original_chunks']} chunks "
+          f"({stats['reduction']:.1%} smaller index)")
+    end_stage("dedup")
     
-    print("🔤 Step 3: Generating embeddings...")
+    print("🔤 Step 4: Generating embeddings...")
     embedder = EmbeddingGenerator()
+    end_stage("load_model")
     embeddings = embedder.generate_embeddings(chunks)
+    end_stage("embed")
     
-    print("💾 Step 4: Saving embeddings and chunks...")
-    # Save embeddings and chunks together
-    with open('models/embeddings.pkl', 'wb') as f:
-        pickle.dump({
-            'embeddings': embeddings,
-            'chunks': chunks
-        }, f)
+    print("💾 Step 5: Saving embeddings and chunks...")
+    # Save embeddings, the memory-mapped chunk store and the legacy pickle
+    duplicates = [{"document": document, "ids": ids} for ids in dedup["duplicates"]]
+    with collection_lock(models_dir):
+        version = save_artifacts(models_dir, embeddings, chunks, duplicates=duplicates, metadata=metadata)
     
     # Also save chunks as text for inspection
-    with open('models/chunks.txt', 'w', encoding='utf-8') as f:
+    with open(os.path.join(models_dir, 'chunks.txt'), 'w', encoding='utf-8') as f:
         for i, chunk in enumerate(chunks):
             f.write(f"=== Chunk {i+1} ===\n")
             f.write(chunk[:500] + "..." if len(chunk) > 500 else chunk)
             f.write(f"\n(Length: {len(chunk)} characters)\n")
             f.write("\n" + "="*50 + "\n\n")
+    end_stage("save")
     
     print("✅ Document processing completed successfully!")
-    print(f"📁 Embeddings saved to: models/embeddings.pkl")
-    print(f"📁 Text preview saved to: models/chunks.txt")
+    print(f"📁 Embeddings and chunk store saved to: {models_dir}/versions/{version} (legacy: {models_dir}/embeddings.pkl)")
+    print(f"📁 Text preview saved to: {models_dir}/chunks.txt")
     print(f"📊 Embeddings shape: {embeddings.shape}")
     
+    if profile:
+        print_profile(timings, time.perf_counter() - started, len(pages), stats, embedder.last_profile)
+    
     return True
 
+def print_profile(timings: dict, total: float, pages: int, dedup_stats: dict, embed_profile: dict):
+    """Print per-stage ingestion timings and throughput"""
+    print("\n⏱️  Ingestion profile")
+    print(f"{'stage':<10}{'seconds':>10}{'share':>9}")
+    for stage, seconds in timings.items():
+        print(f"{stage:<10}{seconds:>10.2f}{seconds / total:>9.1%}")
+    print(f"{'total':<10}{total:>10.2f}")
+    print(f"📄 {pages / total:.2f} pages/sec, {dedup_stats['original_chunks'] / total:.1f} chunks/sec end to end")
+    print(f"🔤 Embedding: {embed_profile['chunks_per_sec']:.1f} chunks/sec, {embed_profile['tokens_per_sec']:.0f} tokens/sec, "
+          f"{embed_profile['batches']} batches, final batch size {embed_profile['final_batch_size']}, "
+          f"{embed_profile['padding_ratio']:.1%} padding")
+
 if __name__ == "__main__":
-    success = process_hr_document()
+    parser = argparse.ArgumentParser(description="Process an HR policy PDF into retrieval artifacts")
+    parser.add_argument("pdf_path", nargs="?", default="HR-Policy (1).pdf")
+    parser.add_argument("--entity", help="Entity the policy applies to, stored as chunk metadata")
+    parser.add_argument("--effective-date", help="Date the policy takes effect (YYYY-MM-DD)")
+    parser.add_argument("--collection", help="Tenant collection id; artifacts go to models/collections/<id>")
+    parser.add_argument("--profile", action="store_true", help="Report per-stage timings, pages/sec and chunks/sec")
+    args = parser.parse_args()
+    # The only workload on this machine: not the API server's per-worker share
+    configure_threads(ThreadBudget.offline())
+    
+    try:
+        models_dir = collection_path("models", args.collection) if args.collection else "models"
+    except UnknownCollection as e:
+        print(f"❌ {e}: use letters, digits, '-' or '_' (up to 64 characters)")
+        sys.exit(1)
+    success = process_hr_document(args.pdf_path, args.entity, args.effective_date, models_dir, args.profile)
     if success:
         print("\n🎉 Document processing complete!")
         print("\n🚀 Now you can start the full RAG system:")
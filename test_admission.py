@@ -0,0 +1,155 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.backend.admission import AdmissionController, Overloaded
+from app.backend.coalescing import SingleFlight
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def settle():
+    """Let queued tasks run up to their next await"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_admits_immediately_below_capacity():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=2)
+        await admission.acquire("a")
+        await admission.acquire("b")
+        assert admission.active == 2 and admission.queued == 0
+        admission.release()
+        admission.release()
+        assert admission.active == 0
+    run(scenario())
+
+def test_times_out_waiting_for_capacity():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_wait=0.05)
+        await admission.acquire("a")
+        with pytest.raises(Overloaded) as rejected:
+            await admission.acquire("b")
+        assert rejected.value.retry_after >= 1
+        assert admission.stats["timed_out"] == 1
+        assert admission.queued == 0 and not admission.queues
+        # The timed-out waiter must not receive the slot
+        admission.release()
+        assert admission.active == 0
+    run(scenario())
+
+def test_cancel_while_queued_frees_the_queue_entry():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1)
+        await admission.acquire("a")
+        waiter = asyncio.ensure_future(admission.acquire("b"))
+        await settle()
+        assert admission.queued == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert admission.queued == 0 and not admission.queues
+        admission.release()
+        assert admission.active == 0
+    run(scenario())
+
+def test_cancel_after_handoff_passes_the_slot_on():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1)
+        await admission.acquire("a")
+        first = asyncio.ensure_future(admission.acquire("b"))
+        second = asyncio.ensure_future(admission.acquire("c"))
+        await settle()
+        # The slot is handed to "b", which is cancelled before it resumes
+        admission.release()
+        first.cancel()
+        outcome = (await asyncio.gather(first, return_exceptions=True))[0]
+        if outcome is None:
+            # "b" resumed holding the slot despite the cancel; it releases as a caller would
+            admission.release()
+        await asyncio.wait_for(second, timeout=1)
+        # Either way the slot went on to "c" and was not leaked
+        assert admission.active == 1 and admission.queued == 0
+        admission.release()
+        assert admission.active == 0
+    run(scenario())
+
+def test_serves_keys_round_robin():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queued_per_key=2)
+        await admission.acquire("holder")
+        order = []
+
+        async def request(key):
+            await admission.acquire(key)
+            order.append(key)
+
+        tasks = []
+        for key in ["busy", "busy", "quiet", "other"]:
+            tasks.append(asyncio.ensure_future(request(key)))
+            await settle()
+        for _ in tasks:
+            admission.release()
+            await settle()
+        await asyncio.gather(*tasks)
+        assert order == ["busy", "quiet", "other", "busy"]
+    run(scenario())
+
+def test_rejects_when_key_or_queue_is_full():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=3, max_queued_per_key=2)
+        await admission.acquire("holder")
+        waiters = [asyncio.ensure_future(admission.acquire(key)) for key in ["a", "a"]]
+        await settle()
+        with pytest.raises(Overloaded, match="conversation"):
+            await admission.acquire("a")
+        waiters.append(asyncio.ensure_future(admission.acquire("b")))
+        await settle()
+        with pytest.raises(Overloaded, match="capacity"):
+            await admission.acquire("c")
+        assert admission.stats["rejected"] == 2
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+    run(scenario())
+
+def test_single_flight_coalesces_identical_requests():
+    async def scenario():
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def answer(question):
+            calls.append(question)
+            release.wait(timeout=5)
+            return {"answer": question.upper()}
+
+        callers = [asyncio.ensure_future(flight.do("q", answer, "leave")) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        assert flight.is_in_flight("q")
+        release.set()
+        results = await asyncio.gather(*callers)
+        assert calls == ["leave"]
+        assert all(result is results[0] for result in results)
+        assert flight.get_stats() == {"executions": 1, "coalesced": 2, "in_flight": 0}
+    run(scenario())
+
+def test_cancelled_caller_does_not_cancel_shared_execution():
+    async def scenario():
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def answer():
+            release.wait(timeout=5)
+            return "done"
+
+        first = asyncio.ensure_future(flight.do("q", answer))
+        second = asyncio.ensure_future(flight.do("q", answer))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        release.set()
+        assert await second == "done"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+    run(scenario())
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from app.ingestion.dedup import canonical_records
+from app.retrieval.metadata import ChunkMetadata, FilterError
+
+RECORDS = [
+    {"document": "HR-Policy", "entity": "Entity A", "section": "Leave", "page": 1, "effective_date": "2024-01-01"},
+    {"document": "HR-Policy", "entity": "Entity A", "section": "Leave", "page": 2, "effective_date": "2024-01-01"},
+    {"document": "HR-Policy", "entity": "Entity B", "section": "Travel", "page": 3, "effective_date": "2024-06-01"},
+    {"document": "Handbook", "entity": None, "section": None, "page": None, "effective_date": None},
+    {"document": "Handbook", "entity": "Entity B", "section": "Conduct", "page": 9, "effective_date": "2025-01-01"},
+] * 3  # 15 chunks, so bitmaps span more than one byte
+
+@pytest.fixture
+def metadata():
+    return ChunkMetadata.from_records(RECORDS)
+
+def selected(metadata, filters):
+    return metadata.ids(metadata.select(filters)).tolist()
+
+def expected(predicate):
+    return [i for i, record in enumerate(RECORDS) if predicate(record)]
+
+def test_no_filters_selects_everything(metadata):
+    assert metadata.select(None) is None
+    assert metadata.select({}) is None
+
+def test_categorical_equality_and_any_of(metadata):
+    assert selected(metadata, {"document": "Handbook"}) == expected(lambda r: r["document"] == "Handbook")
+    assert selected(metadata, {"entity": ["Entity A", "Entity B"]}) == expected(lambda r: r["entity"] is not None)
+    assert selected(metadata, {"section": {"in": ["Leave"]}}) == expected(lambda r: r["section"] == "Leave")
+    assert selected(metadata, {"document": "Unknown"}) == []
+
+def test_numeric_ranges_skip_missing_values(metadata):
+    assert selected(metadata, {"page": {"gte": 2, "lte": 3}}) == expected(lambda r: r["page"] in (2, 3))
+    assert selected(metadata, {"page": {"gt": 0}}) == expected(lambda r: r["page"] is not None)
+    assert selected(metadata, {"page": [1, 9]}) == expected(lambda r: r["page"] in (1, 9))
+
+def test_date_filters(metadata):
+    assert selected(metadata, {"effective_date": {"lte": "2024-06-01"}}) == \
+        expected(lambda r: r["effective_date"] is not None and r["effective_date"] <= "2024-06-01")
+    assert selected(metadata, {"effective_date": "2025-01-01"}) == expected(lambda r: r["effective_date"] == "2025-01-01")
+
+def test_conditions_are_combined_with_and(metadata):
+    filters = {"document": "HR-Policy", "entity": "Entity A", "page": {"gte": 2}}
+    assert selected(metadata, filters) == expected(lambda r: r["document"] == "HR-Policy" and r["entity"] == "Entity A"
+                                                   and r["page"] is not None and r["page"] >= 2)
+
+@pytest.mark.parametrize("filters", [
+    {"document": [["x"]]},
+    {"document": 3},
+    {"document": {}},
+    {"document": {"gt": "a"}},
+    {"document": {"in": "HR-Policy"}},
+    {"effective_date": {"lte": 20240101}},
+    {"effective_date": {"lte": "soon"}},
+    {"effective_date": {}},
+    {"page": {"gte": "three"}},
+    {"page": {"gte": 2.5}},
+    {"page": {"in": 3}},
+    {"page": {"between": [1, 2]}},
+    {"pages": 1},
+])
+def test_malformed_filters_raise_filter_error(metadata, filters):
+    with pytest.raises(FilterError):
+        metadata.select(filters)
+
+def test_records_round_trip(metadata, tmp_path):
+    metadata.save(str(tmp_path))
+    loaded = ChunkMetadata.load(str(tmp_path))
+    assert loaded.to_records() == metadata.to_records()
+    assert metadata.to_records()[3] == {"document": "Handbook", "entity": None, "section": None,
+                                        "page": None, "effective_date": None}
+
+def test_collapsed_duplicates_match_filters_of_every_copy(tmp_path):
+    # Chunks 0, 2 and 3 are the same footer; 0 is kept as the representative
+    dedup = {"representatives": [0, 1], "duplicates": [[0, 2, 3], [1]]}
+    records = canonical_records(RECORDS[:4], dedup)
+    assert records[0]["pages"] == [1, 3] and records[0]["sections"] == ["Leave", "Travel"]
+    assert "pages" not in records[1]
+
+    metadata = ChunkMetadata.from_records(records)
+    assert selected(metadata, {"page": 3}) == [0]
+    assert selected(metadata, {"page": {"gte": 2, "lte": 3}}) == [0, 1]
+    assert selected(metadata, {"page": {"gt": 3}}) == []
+    assert selected(metadata, {"section": "Travel"}) == [0]
+    assert selected(metadata, {"section": {"in": ["Leave"]}, "page": 2}) == [1]
+
+    metadata.save(str(tmp_path))
+    loaded = ChunkMetadata.load(str(tmp_path))
+    assert loaded.to_records() == metadata.to_records()
+    assert loaded.to_records()[0]["pages"] == [1, 3]
+    assert selected(loaded, {"section": "Travel"}) == [0]
+
+def test_bitmap_matches_faiss_id_selector(metadata):
+    faiss = pytest.importorskip("faiss")
+    vectors = np.random.RandomState(0).rand(len(RECORDS), 8).astype(np.float32)
+    index = faiss.IndexFlatIP(8)
+    index.add(vectors)
+
+    bitmap = metadata.select({"entity": "Entity B"})
+    selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+    assert [i for i in range(len(RECORDS)) if selector.is_member(i)] == metadata.ids(bitmap).tolist()
+
+    _, indices = index.search(vectors[:1], len(RECORDS), params=faiss.SearchParameters(sel=selector))
+    assert sorted(indices[0][indices[0] >= 0].tolist()) == metadata.ids(bitmap).tolist()